@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import partial
+from typing import Callable, List
+from src.models.base import ValidationError
+from src.services.concurrent import ConcurrentAddressBook, ConcurrentNoteBook
+from src.services.index import PostingIndex
+from src.services.notebook import NoteBook
+from src.services.record import Record
+from src.services.storage import AddressBook
+from .data import TAGS, build_contacts, build_notes
+
+# Writers move phones between contacts and tags between notes, so the totals
+# never change; readers check them on snapshots while searching and saving.
+# Editors change contacts through find() without taking the lock themselves:
+# they replace phones, which keeps the totals, and add phones to one contact
+# kept out of them, which must end up with every phone added.
+TARGET = "StressTarget"
+
+
+class Stress:
+    def __init__(self, count: int, seed: int):
+        self.book = ConcurrentAddressBook()
+        self.book.data = build_contacts(count, seed)
+        for record in self.book.data.values():
+            record._book = self.book
+        self.notebook = ConcurrentNoteBook()
+        self.notebook.notes = build_notes(count, seed)
+        self.names = list(self.book.data)
+        self.titles = list(self.notebook.notes)
+        self.phones = sum(len(r.phones) for r in self.book.data.values())
+        self.book.add_record(Record(TARGET))
+        self.numbers = itertools.count()
+        self.added = 0
+        self.tags = sum(len(n.tags) for n in self.notebook.notes.values())
+        self.stop = threading.Event()
+        self.ops = Counter()
+        self.failures: List[str] = []
+        self.failures_lock = threading.Lock()
+
+    def fail(self, message: str) -> None:
+        with self.failures_lock:
+            self.failures.append(message)
+        self.stop.set()
+
+    def run(self, name: str, step: Callable[[random.Random], None], seed: int):
+        rng = random.Random(seed)
+        done = 0
+        try:
+            while not self.stop.is_set():
+                step(rng)
+                done += 1
+        except Exception as e:
+            self.fail(f"{name}: {type(e).__name__}: {e}")
+        with self.failures_lock:
+            self.ops[name] += done
+
+    def move_phone(self, rng: random.Random) -> None:
+        book = self.book
+        with book.lock.write():
+            source = book.find(rng.choice(self.names))
+            target = book.find(rng.choice(self.names))
+            if not source.phones or source.name.value == target.name.value:
+                return
+            phone = rng.choice(source.phones).value
+            if target.find_phone(phone):
+                return
+            source.remove_phone(phone)
+            target.add_phone(phone)
+
+    def move_tag(self, rng: random.Random) -> None:
+        notebook = self.notebook
+        with notebook.lock.write():
+            source = notebook.find_note(rng.choice(self.titles))
+            target = notebook.find_note(rng.choice(self.titles))
+            if not source.tags:
+                return
+            tag = rng.choice(sorted(source.tags))
+            if tag in target.tags:
+                return
+            notebook.remove_tag(source.title, tag)
+            notebook.add_tag(target.title, tag)
+
+    def edit_phone(self, rng: random.Random) -> None:
+        record = self.book.find(rng.choice(self.names))
+        if not record.phones:
+            return
+        phone = rng.choice(record.phones).value
+        try:
+            record.edit_phone(phone, f"05{next(self.numbers):08d}")
+        except ValidationError:
+            # Moved to another contact since it was read.
+            pass
+
+    def add_phone(self, rng: random.Random) -> None:
+        self.book.find(TARGET).add_phone(f"06{next(self.numbers):08d}")
+        with self.failures_lock:
+            self.added += 1
+
+    def check_totals(self, rng: random.Random) -> None:
+        phones = sum(
+            len(record.phones)
+            for record in self.book.iter_records()
+            if record.name.value != TARGET
+        )
+        if phones != self.phones:
+            self.fail(f"snapshot has {phones} phones, expected {self.phones}")
+        tags = sum(len(note.tags) for note in self.notebook.iter_notes())
+        if tags != self.tags:
+            self.fail(f"snapshot has {tags} tags, expected {self.tags}")
+
+    def search(self, rng: random.Random) -> None:
+        book, notebook = self.book, self.notebook
+        book.search(rng.choice(self.names)[:3].lower())
+        record = book.find(rng.choice(self.names))
+        for phone in record.phones:
+            book.find_owners(phone.value)
+        book.get_upcoming_birthdays(rng.randint(1, 60))
+        tag = rng.choice(TAGS)
+        notebook.query_tags(any_of=[tag])
+        notebook.search_by_text(rng.choice(["meeting", "budget", "train"]))
+        notebook.query(f"tag:{tag} AND text:the")
+        notebook.recent_notes(10)
+        notebook.rank_by_text("budget review", 5)
+
+    def save(self, directory: str, rng: random.Random) -> None:
+        contacts = os.path.join(directory, "addressbook.pkl")
+        notes = os.path.join(directory, "notebook.pkl")
+        self.book.save_to_file(contacts)
+        self.notebook.save_to_file(notes)
+        book = AddressBook()
+        book.load_from_file(contacts)
+        phones = sum(
+            len(record.phones) for name, record in book.data.items() if name != TARGET
+        )
+        notebook = NoteBook()
+        notebook.load_from_file(notes)
+        tags = sum(len(note.tags) for note in notebook.notes.values())
+        book.close()
+        notebook.close()
+        if (phones, tags) != (self.phones, self.tags):
+            self.fail(f"saved {phones} phones and {tags} tags")
+
+    def check_added(self) -> None:
+        phones = len(self.book.find(TARGET).phones)
+        if phones != self.added:
+            self.fail(f"{TARGET} has {phones} phones, {self.added} were added")
+
+    def check_indexes(self) -> None:
+        # The indexes kept up to date by the writers must match fresh ones.
+        for record in self.book.data.values():
+            for phone in record.phones:
+                owners = [r.name.value for r in self.book.find_owners(phone.value)]
+                if record.name.value not in owners:
+                    self.fail(f"{phone.value} not indexed for {record.name.value}")
+        fresh = PostingIndex()
+        for note in self.notebook.notes.values():
+            fresh.add(note.title, note.tags)
+        for tag in TAGS:
+            if sorted(fresh.get(tag)) != sorted(self.notebook.tag_index.get(tag)):
+                self.fail(f"tag index differs for '{tag}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stress the thread-safe address book and notebook"
+    )
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--savers", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    stress = Stress(args.count, args.seed)
+    # Build the indexes first, so the writers keep them up to date.
+    stress.search(random.Random(args.seed))
+    with tempfile.TemporaryDirectory() as tmp:
+        steps = []
+        for _ in range(args.writers):
+            steps += [
+                ("move_phone", stress.move_phone),
+                ("move_tag", stress.move_tag),
+                ("edit_phone", stress.edit_phone),
+                ("add_phone", stress.add_phone),
+            ]
+        for i in range(args.readers):
+            steps.append(
+                ("check_totals", stress.check_totals)
+                if i % 2 == 0
+                else ("search", stress.search)
+            )
+        for i in range(args.savers):
+            directory = os.path.join(tmp, str(i))
+            os.mkdir(directory)
+            steps.append(("save", partial(stress.save, directory)))
+        threads = [
+            threading.Thread(target=stress.run, args=(name, step, args.seed + i))
+            for i, (name, step) in enumerate(steps)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stress.stop.wait(args.seconds)
+        stress.stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    stress.check_added()
+    stress.check_indexes()
+
+    for name, done in sorted(stress.ops.items()):
+        print(f"{name:<14} {done:>9} ops {done / elapsed:>10.0f}/s")
+    print(
+        f"dictionary copies: contacts {stress.book.views.copies}, "
+        f"notes {stress.notebook.views.copies}"
+    )
+    for failure in stress.failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+    if stress.failures:
+        sys.exit(1)
+    print("All invariants held.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+from src.models.base import Note
+from src.services.record import Record
+
+# fmt: off
+FIRST_NAMES = [
+    "Anna", "Bohdan", "Daria", "Dmytro", "Iryna", "Ivan", "Kateryna", "Maksym",
+    "Maria", "Mykola", "Nadia", "Oksana", "Oleh", "Olena", "Petro", "Roman",
+    "Sofia", "Stepan", "Taras", "Viktoria", "Yulia", "Yurii", "Zoya", "Andrii",
+    "Emma", "Liam", "Noah", "Olivia", "Lucas", "Mia", "Hugo", "Chloe",
+]
+LAST_NAMES = [
+    "Bondarenko", "Boyko", "Hnatiuk", "Koval", "Kovalenko", "Kravchenko",
+    "Lysenko", "Marchenko", "Melnyk", "Moroz", "Oliinyk", "Petrenko",
+    "Polishchuk", "Savchenko", "Shevchenko", "Tkachenko", "Tkachuk", "Vovk",
+    "Smith", "Brown", "Garcia", "Martin", "Muller", "Rossi", "Novak", "Dubois",
+]
+# fmt: on
+DOMAINS = ["gmail.com", "ukr.net", "outlook.com", "proton.me", "example.org"]
+STREETS = ["Khreshchatyk", "Shevchenka", "Franka", "Lesi Ukrainky", "Main", "Oak"]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Warsaw", "Berlin"]
+# fmt: off
+TAGS = [
+    "work", "home", "ideas", "todo", "urgent", "family", "travel", "books",
+    "health", "finance", "project", "meeting", "shopping", "recipes", "music",
+    "study", "python", "sport", "car", "garden", "gifts", "movies", "events",
+    "bugs", "release", "design", "research", "friends", "kids", "pets",
+]
+# fmt: on
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this are or "
+    "his from at which but have an they you were her she there one all we can "
+    "meeting call buy milk report deadline review plan trip budget idea draft "
+    "doctor appointment birthday present release build deploy fix bug test "
+    "book flight hotel ticket invoice tax payment garden paint kitchen school "
+    "lecture homework exam recipe dinner coffee concert movie train weekend"
+).split()
+
+
+def zipf_weights(count: int) -> List[float]:
+    # A few tags and words are common, most are rare, as in real notebooks.
+    return [1 / rank for rank in range(1, count + 1)]
+
+
+def contact_name(i: int, rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)}{rng.choice(LAST_NAMES)}{i}"
+
+
+def build_contacts(count: int, seed: int = 0) -> Dict[str, Record]:
+    rng = random.Random(seed)
+    first_day = date(1950, 1, 1).toordinal()
+    last_day = date(2005, 12, 31).toordinal()
+    contacts = {}
+    for i in range(count):
+        record = Record(contact_name(i, rng))
+        for _ in range(rng.choices([0, 1, 2, 3], [5, 60, 25, 10])[0]):
+            record.add_phone(f"0{rng.randrange(10**8, 10**9)}")
+        if rng.random() < 0.5:
+            user = record.name.value.lower().rstrip("0123456789")
+            record.add_email(f"{user}{rng.randint(1, 99)}@{rng.choice(DOMAINS)}")
+        if rng.random() < 0.3:
+            record.add_address(
+                f"{rng.randint(1, 200)} {rng.choice(STREETS)} st, "
+                f"{rng.choice(CITIES)}"
+            )
+        if rng.random() < 0.6:
+            birthday = date.fromordinal(rng.randint(first_day, last_day))
+            record.add_birthday(birthday.strftime("%d.%m.%Y"))
+        contacts[record.name.value] = record
+    return contacts
+
+
+def build_notes(count: int, seed: int = 0) -> Dict[str, Note]:
+    rng = random.Random(seed)
+    tag_weights = zipf_weights(len(TAGS))
+    word_weights = zipf_weights(len(WORDS))
+    start = datetime(2023, 1, 1)
+    notes = {}
+    for i in range(count):
+        words = rng.choices(WORDS, word_weights, k=rng.randint(5, 60))
+        tag_count = rng.choices([0, 1, 2, 4], [1, 4, 3, 1])[0]
+        tags = set(rng.choices(TAGS, tag_weights, k=tag_count))
+        title = f"note{i}-{words[0]}"
+        note = Note(title, " ".join(words), tags)
+        note.created_at = start + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+        note.modified_at = note.created_at + timedelta(
+            seconds=rng.choice([0, 0, rng.randrange(30 * 86400)])
+        )
+        notes[title] = note
+    return notes
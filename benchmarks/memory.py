@@ -0,0 +1,25 @@
+import argparse
+import tracemalloc
+from .data import build_contacts, build_notes
+
+
+def measure(build, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(items) == count
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per contact and per note")
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+    print(f"bytes per contact: {measure(build_contacts, args.count):.0f}")
+    print(f"bytes per note: {measure(build_notes, args.count):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from src.bot import Bot
+from src.services.notebook import NoteBook
+from src.services.storage import AddressBook
+from .data import LAST_NAMES, TAGS, WORDS, build_contacts, build_notes
+
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def timed(func: Callable[[], object], ops: int, repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) / ops)
+    return {"median": statistics.median(samples), "min": min(samples), "ops": ops}
+
+
+def typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+def run_size(count: int, seed: int, repeat: int, queries: int) -> Dict[str, Dict]:
+    rng = random.Random(seed)
+    contacts = build_contacts(count, seed)
+    notes = build_notes(count, seed)
+    names = rng.sample(list(contacts), min(queries, len(contacts)))
+    titles = rng.sample(list(notes), min(queries, len(notes)))
+    owned = [p.value for name in names for p in contacts[name].phones]
+    owned += [contacts[name].email.value for name in names if contacts[name].email]
+    results = {}
+
+    def bench(name: str, func: Callable[[], object], ops: int = 1, warm=True):
+        if warm:
+            func()
+        results[name] = timed(func, ops, repeat)
+        print(
+            f"{count:>9} {name:<22} {results[name]['median'] * 1e3:10.3f} ms",
+            file=sys.stderr,
+        )
+
+    book = AddressBook()
+    book.data = contacts
+    notebook = NoteBook()
+    notebook.notes = notes
+    bench("save_contacts", lambda: book.save_to_file("addressbook.pkl"), warm=False)
+    bench("save_notes", lambda: notebook.save_to_file("notebook.pkl"), warm=False)
+    del book, notebook, contacts, notes
+
+    def load(cls: type, filename: str) -> None:
+        store = cls()
+        store.load_from_file(filename)
+        store.close()
+
+    def index_contacts() -> None:
+        book = AddressBook()
+        book.load_from_file("addressbook.pkl")
+        book.search_index
+        book.close()
+
+    bench("load_contacts", lambda: load(AddressBook, "addressbook.pkl"))
+    bench("load_notes", lambda: load(NoteBook, "notebook.pkl"))
+    bench("index_contacts", index_contacts, warm=False)
+
+    def first_command(command: str) -> Callable[[], None]:
+        def run() -> None:
+            bot = Bot()
+            bot.execute(command)
+            bot.close()
+
+        return run
+
+    # Stores load on first use, so startup alone no longer touches the data.
+    bench("bot_startup", lambda: Bot().close())
+    bench("bot_first_command", first_command(f"phone {names[0]}"))
+
+    bot = Bot()
+    # Broad queries match a share of the book, narrow ones a contact or two.
+    contact_queries = [rng.choice(LAST_NAMES)[1:6].lower() for _ in range(10)]
+    contact_queries += [name[-7:] for name in names]
+    text_queries = rng.sample(WORDS, 10) + [" ".join(rng.sample(WORDS, 2))]
+    tag_queries = [rng.sample(TAGS, 2) for _ in range(10)]
+    typos = [typo(name, rng) for name in names]
+    command_typos = [typo(command, rng) for command in bot.commands if len(command) > 2]
+
+    # A fresh process answers its first search, whois, birthdays query or
+    # mistyped name before any index has been built.
+    bench("cold_find", first_command(f"find {contact_queries[0]} --limit 10"))
+    bench("cold_whois", first_command(f"whois {owned[0]}"))
+    bench("cold_birthdays", first_command("birthdays 7"))
+    bench("cold_suggest", first_command(f"phone {typos[0]}"))
+
+    def each(queries: List, func: Callable) -> Tuple[Callable[[], None], int]:
+        return (lambda: [func(query) for query in queries]), len(queries)
+
+    bench("find_contacts", *each(contact_queries, bot.book.search))
+    bench("search_by_text", *each(text_queries, bot.notebook.search_by_text))
+    bench("search_by_tags", *each(tag_queries, bot.notebook.search_by_tags))
+    bench(
+        "rank_by_text",
+        *each(text_queries, lambda query: bot.notebook.rank_index.top(query, 10)),
+    )
+    # A rare tag narrows a common word and a date range to a few candidates.
+    note_queries = [
+        f'tag:{rng.choice(TAGS[-10:])} text:"{rng.choice(WORDS[:10])}" '
+        f"modified>2024-0{rng.randint(1, 9)}-01"
+        for _ in range(10)
+    ]
+    bench("query_notes", *each(note_queries, bot.notebook.query))
+    bench("recent_notes", lambda: bot.notebook.recent_notes(20))
+    day = datetime(2024, 1, 1)
+    bench(
+        "notes_between",
+        lambda: list(bot.notebook.iter_notes_between(day, day + timedelta(days=7))),
+    )
+    bench("upcoming_birthdays", lambda: bot.book.get_upcoming_birthdays(7))
+    bench("closest_command", *each(command_typos, bot.find_closest_command))
+    bench("suggest_contact", *each(typos, bot.book.suggest))
+    bench("whois", *each(owned, bot.book.find_owners))
+
+    commands = []
+    for i, name in enumerate(names):
+        commands += [
+            f"phone {name}",
+            f"find {contact_queries[i % len(contact_queries)]} --limit 10",
+            f"show-note {titles[i % len(titles)]}",
+            f"search-notes {rng.choice(WORDS)} --limit 10",
+            f"search-tags {rng.choice(TAGS)} --limit 10",
+            "birthdays 7",
+            f"whois {owned[i % len(owned)]}",
+        ]
+    bench("dispatch", *each(commands, bot.execute))
+    # Integrations poll the same few listings between rare writes.
+    polls = [f"find {query} --limit 10" for query in contact_queries[:5]]
+    polls += [f"search-notes {query} --limit 10" for query in text_queries[:5]]
+    polls += ["birthdays 7"]
+    bench("poll_repeated", *each(polls, bot.execute))
+    bot.close()
+    return results
+
+
+def compare(
+    results: Results, baseline: Results, threshold: float
+) -> List[Tuple[str, str, float, float]]:
+    regressions = []
+    for size, benches in results.items():
+        for name, result in benches.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous is None:
+                continue
+            if result["median"] > previous["median"] * (1 + threshold):
+                regressions.append((size, name, previous["median"], result["median"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time memok's hot paths")
+    parser.add_argument("--sizes", default="10000", help="e.g. 10000,100000,1000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="flag benchmarks this much slower than the baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args()
+
+    baseline: Optional[Results] = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results: Results = {}
+    cwd = os.getcwd()
+    for size in (int(size) for size in args.sizes.split(",")):
+        # The bot reads and writes its data files in the working directory.
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                results[str(size)] = run_size(
+                    size, args.seed, args.repeat, args.queries
+                )
+            finally:
+                os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "queries": args.queries,
+            "unit": "seconds per operation",
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, before, after in regressions:
+            print(
+                f"REGRESSION {name} at {size}: {before * 1e3:.3f} ms -> "
+                f"{after * 1e3:.3f} ms ({after / before - 1:+.0%})",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,228 @@
-from typing import List, Tuple, Callable, Optional
-from .services.storage import AddressBook
-from .services.notebook import NoteBook
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Callable, Optional, Union
+from .services.storage import AddressBook, SEARCH_FIELDS
+from .services.notebook import NoteBook, TagClause
+from .services.blobs import BlobStore
+from .services.paging import Page
+from .services.query import parse_time
+from .services.writer import BackgroundWriter
 from .services.record import Record
-from .models.base import ValidationError
-from difflib import get_close_matches
+from .services.backends import (
+    SnapshotBackend,
+    SqliteContactBackend,
+    SqliteDatabase,
+    SqliteNoteBackend,
+)
+from .models.base import ConflictError, Note, NotFoundError, ValidationError
+from .services.index import SuggestionIndex
+from .services.metrics import COMMAND_ERRORS, COMMAND_SECONDS, METRICS, OBJECTS
+from .services.metrics import STARTUP_SECONDS, STORAGE_READ, STORAGE_SECONDS
+from .services.metrics import CACHE_REQUESTS, STORAGE_WRITTEN
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
 
 
 def input_error(func: Callable):
-    def wrapper(*args, **kwargs):
+    def wrapper(self, *args, **kwargs):
+        self.last_error = None
         try:
-            return func(*args, **kwargs)
+            return func(self, *args, **kwargs)
         except ValidationError as e:
+            self.last_error = e
             return f"Validation error: {str(e)}"
-        except IndexError:
+        except ConflictError as e:
+            self.last_error = e
+            return f"Conflict: {str(e)}"
+        except IndexError as e:
+            self.last_error = e
             return "Please provide all required arguments"
         except KeyError as e:
+            self.last_error = e
+            suggestions = getattr(e, "suggestions", None)
+            if suggestions:
+                return f"Not found: {str(e)}. Did you mean '{suggestions[0]}'?"
             return f"Not found: {str(e)}"
         except Exception as e:
+            self.last_error = e
             return f"An error occurred: {str(e)}"
 
     return wrapper
 
 
-class Bot:
+class Session:
+    # What one client's commands share: the listing that 'next' continues.
+    # The terminal has one; in server mode each connection gets its own.
     def __init__(self):
-        self.book = AddressBook()
-        self.notebook = NoteBook()
-        self.book.load_from_file()
-        self.notebook.load_from_file()
+        self.last_page: Optional[Page] = None
+
+
+class Bot:
+    MUTATING_COMMANDS = frozenset(
+        [
+            "add",
+            "change",
+            "delete-contact",
+            "add-birthday",
+            "add-email",
+            "add-address",
+            "add-note",
+            "delete-note",
+            "edit-note",
+            "add-tag",
+            "remove-tag",
+            "import",
+            "compact-notes",
+        ]
+    )
+
+    def __init__(
+        self,
+        storage: str = "pickle",
+        database: str = "memok.db",
+        save_interval: float = 0.0,
+        fsync: bool = False,
+        warm: bool = False,
+        started: Optional[float] = None,
+        blob_threshold: int = 0,
+        blob_codec: str = "zlib",
+    ):
+        self.started = time.perf_counter() if started is None else started
+        self.storage = storage
+        self.database_filename = database
+        self.fsync = fsync
+        # Note bodies of at least blob_threshold bytes go to a blob store.
+        self.blobs = BlobStore("notebook.blobs", blob_threshold or None, blob_codec)
+        self.blobs.fsync = fsync
+        self.autosave = True
+        self.pending_changes = 0
+        self.default_session = Session()
+        self._local = threading.local()
+        # Commands and background saves take turns on the stores.
+        self.lock = threading.RLock()
+        self.writer: Optional[BackgroundWriter] = None
+        if save_interval > 0:
+            self.writer = BackgroundWriter(self._background_commit, save_interval)
+        # Stores are loaded by the first command that needs them. Both SQLite
+        # stores share one connection, so they are loaded one at a time.
+        self._stores: Dict[str, Union[AddressBook, NoteBook]] = {}
+        self._database: Optional[SqliteDatabase] = None
+        if storage == "sqlite":
+            self._loading = dict.fromkeys(("book", "notebook"), threading.Lock())
+        else:
+            self._loading = {"book": threading.Lock(), "notebook": threading.Lock()}
+        self._warmers: List[threading.Thread] = []
+        # Other memok processes may share the data files; their changes are
+        # picked up before each command.
+        self.auto_refresh = True
+        if warm:
+            self.warm_up()
         self._setup_commands()
+        OBJECTS.set_function(lambda: self._loaded_count("book"), kind="contacts")
+        OBJECTS.set_function(lambda: self._loaded_count("notebook"), kind="notes")
+        OBJECTS.set_function(lambda: self.pending_changes, kind="pending_changes")
+
+    def _loaded_count(self, name: str) -> Optional[int]:
+        # Stores that were never loaded are not loaded just to be counted.
+        store = self._stores.get(name)
+        if store is None:
+            return None
+        return len(store.notes) if isinstance(store, NoteBook) else len(store)
+
+    @property
+    def book(self) -> AddressBook:
+        return self._store("book")
+
+    @property
+    def notebook(self) -> NoteBook:
+        return self._store("notebook")
+
+    def _store(self, name: str) -> Union[AddressBook, NoteBook]:
+        store = self._stores.get(name)
+        if store is not None:
+            return store
+        with self._loading[name]:
+            store = self._stores.get(name)
+            if store is None:
+                store = self._stores[name] = self._load_store(name)
+            return store
+
+    def _load_store(self, name: str) -> Union[AddressBook, NoteBook]:
+        if name == "book":
+            store = AddressBook()
+            if self.storage == "sqlite":
+                backend = SqliteContactBackend(self._sqlite(), Record.from_dict)
+                # Existing data files are imported into an empty database once.
+                backend.migrate_from(
+                    SnapshotBackend("addressbook.pkl", Record.from_dict, Record.FIELDS)
+                )
+                store.open(backend)
+            else:
+                store.load_from_file()
+        else:
+            store = NoteBook()
+            store.blobs = self.blobs
+            if self.storage == "sqlite":
+                backend = SqliteNoteBackend(self._sqlite(), Note.from_dict)
+                backend.migrate_from(
+                    SnapshotBackend("notebook.pkl", Note.from_dict, Note.FIELDS)
+                )
+                store.open(backend)
+            else:
+                store.load_from_file()
+        store.backend.set_durability(self.fsync)
+        if self.writer is not None:
+            store.on_change = self.writer.notify
+        return store
+
+    def _sqlite(self) -> SqliteDatabase:
+        if self._database is None:
+            self._database = SqliteDatabase(self.database_filename)
+        return self._database
+
+    def is_stale(self) -> bool:
+        return any(store.backend.stale() for store in list(self._stores.values()))
+
+    def refresh(self) -> None:
+        for store in list(self._stores.values()):
+            store.refresh()
+
+    def warm_up(self) -> None:
+        # Loads both stores on background threads while the prompt is already
+        # up; a command that needs a store still loading waits for it.
+        def load(name: str) -> None:
+            try:
+                self._store(name)
+            except Exception:
+                pass  # The command that needs the store reports the error.
+
+        for name in ("book", "notebook"):
+            thread = threading.Thread(
+                target=load, args=(name,), name=f"memok-load-{name}", daemon=True
+            )
+            thread.start()
+            self._warmers.append(thread)
+
+    def mark_started(self, stage: str) -> None:
+        STARTUP_SECONDS.observe(time.perf_counter() - self.started, stage=stage)
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        # Per thread, so concurrent commands in server mode keep their own.
+        return getattr(self._local, "last_error", None)
+
+    @last_error.setter
+    def last_error(self, error: Optional[Exception]) -> None:
+        self._local.last_error = error
+
+    @property
+    def session(self) -> Session:
+        # The session of the command running on this thread.
+        return getattr(self._local, "session", None) or self.default_session
 
     def _setup_commands(self):
         self.commands = {
@@ -36,13 +230,20 @@ class Bot:
             "change": self.change_contact,
             "phone": self.show_phone,
             "all": self.show_all,
+            "next": self.next_page,
             "find": self.find_contacts,
+            "whois": self.whois,
+            "duplicates": self.show_duplicates,
             "delete-contact": self.delete_contact,
             "add-birthday": self.add_birthday,
             "show-birthday": self.show_birthday,
             "birthdays": self.birthdays,
+            "birthdays-month": self.birthdays_in_month,
+            "birthdays-between": self.birthdays_between,
             "add-email": self.add_email,
             "add-address": self.add_address,
+            "import": self.import_contacts,
+            "export": self.export_contacts,
             "add-note": self.add_note,
             "show-note": self.show_note,
             "all-notes": self.show_all_notes,
@@ -51,23 +252,74 @@ class Bot:
             "add-tag": self.add_tag,
             "remove-tag": self.remove_tag,
             "search-notes": self.search_notes,
+            "query": self.query_notes,
+            "recent-notes": self.recent_notes,
+            "notes-since": self.notes_since,
+            "notes-between": self.notes_between,
             "search-tags": self.search_by_tags,
+            "tags": self.show_tags,
+            "compact-notes": self.compact_notes,
+            "stats": self.show_stats,
+            "dump-stats": self.dump_stats,
+            "profile": self.profile_command,
             "help": self.show_help,
             "hello": lambda _: "How can I help you?",
         }
+        self.command_index = SuggestionIndex([*self.commands, "exit", "close"])
 
     def find_closest_command(self, user_input: str) -> Optional[str]:
-        words = user_input.lower().split()
-        all_commands = list(self.commands.keys())
-        for word in words:
-            matches = get_close_matches(word, all_commands, n=1, cutoff=0.6)
+        for word in user_input.lower().split():
+            matches = self.command_index.suggest(word)
             if matches:
                 return matches[0]
         return None
 
+    def find_record(self, name: str) -> Record:
+        record = self.book.find(name)
+        if record is None:
+            raise NotFoundError(name, self.book.suggest(name))
+        return record
+
+    def find_note(self, title: str) -> Note:
+        note = self.notebook.find_note(title)
+        if note is None:
+            raise NotFoundError(title, self.notebook.suggest(title))
+        return note
+
     def save_data(self):
-        self.book.save_to_file()
-        self.notebook.save_to_file()
+        # With a background writer the stores have already scheduled a save.
+        if not self.autosave or self.writer is not None:
+            self.pending_changes += 1
+            return
+        self.flush()
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+            return
+        self.pending_changes = 0
+        # Stores that were never loaded have nothing to save.
+        for store in list(self._stores.values()):
+            store.commit()
+
+    def _background_commit(self):
+        with self.lock:
+            self.pending_changes = 0
+        for store in list(self._stores.values()):
+            store.commit(self.lock)
+
+    def close(self):
+        for thread in self._warmers:
+            thread.join()
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            self.flush()
+        for store in self._stores.values():
+            store.close()
+
+    def _locked(self):
+        return self.lock if self.writer is not None else nullcontext()
 
     def parse_input(self, user_input: str) -> Tuple[str, List[str]]:
         parts = user_input.strip().split()
@@ -94,9 +346,7 @@ class Bot:
         if len(args) < 3:
             raise IndexError
         name, old_phone, new_phone = args[0], args[1], args[2]
-        record = self.book.find(name)
-        if not record:
-            raise KeyError(name)
+        record = self.find_record(name)
         record.edit_phone(old_phone, new_phone)
         self.save_data()
         return "Phone number updated."
@@ -105,38 +355,102 @@ class Bot:
     def show_phone(self, args: List[str]) -> str:
         if not args:
             raise IndexError
-        record = self.book.find(args[0])
-        if not record:
-            raise KeyError(args[0])
+        record = self.find_record(args[0])
         return str(record)
 
+    def parse_page_args(self, args: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+        rest, options = [], {}
+        tokens = iter(args)
+        for token in tokens:
+            option, sep, value = token.partition("=")
+            if option not in ("--limit", "--offset", "--after"):
+                rest.append(token)
+                continue
+            if not sep:
+                value = next(tokens, None)
+                if value is None:
+                    raise IndexError
+            if option == "--after":
+                options["after"] = value
+                continue
+            if not value.isdigit():
+                raise ValidationError(f"{option} must be a non-negative number")
+            options[option[2:]] = int(value)
+        return rest, options
+
+    def _page(
+        self, source, key: Callable[[Any], str], options: Dict[str, Any], **kwargs
+    ) -> Page:
+        page = Page(source, key, **kwargs, **options)
+        self.session.last_page = page
+        return page
+
     @input_error
-    def show_all(self, _: List[str]) -> str:
-        if not self.book.data:
-            return "No contacts saved."
-        return "\n".join(str(record) for record in self.book.data.values())
+    def show_all(self, args: List[str]) -> Page:
+        _, options = self.parse_page_args(args)
+        return self._page(
+            self.book.iter_records,
+            lambda record: record.name.value,
+            options,
+            empty="No contacts saved.",
+        )
+
+    @input_error
+    def next_page(self, _: List[str]) -> Union[Page, str]:
+        session = self.session
+        page = session.last_page.next_page() if session.last_page else None
+        if page is None:
+            return "No more results."
+        session.last_page = page
+        return page
+
+    @input_error
+    def find_contacts(self, args: List[str]) -> Page:
+        args, options = self.parse_page_args(args)
+        if not args:
+            raise IndexError
+        query = " ".join(args)
+        field = None
+        prefix, sep, rest = query.partition(":")
+        if sep and prefix.lower() in SEARCH_FIELDS:
+            field, query = prefix.lower(), rest
+        return self._page(
+            self.book.search_listing(query, field),
+            lambda name: name,
+            options,
+            render=self.book.render,
+            empty="No matching contacts found.",
+        )
 
     @input_error
-    def find_contacts(self, args: List[str]) -> str:
+    def whois(self, args: List[str]) -> str:
         if not args:
             raise IndexError
-        query = args[0].lower()
-        matches = []
-        for record in self.book.data.values():
-            if (
-                query in record.name.value.lower()
-                or any(query in phone.value for phone in record.phones)
-                or (record.email and query in record.email.value.lower())
-                or (record.address and query in record.address.value.lower())
-            ):
-                matches.append(str(record))
-        return "\n".join(matches) if matches else "No matching contacts found."
+        value = " ".join(args)
+        records = self.book.find_owners(value)
+        if not records:
+            return f"No contact has {value}."
+        return "\n".join(str(record) for record in records)
+
+    @input_error
+    def show_duplicates(self, args: List[str]) -> Page:
+        args, options = self.parse_page_args(args)
+        field = args[0].lower() if args else None
+        self.book.iter_duplicates(field)  # Rejects unknown fields up front.
+        return self._page(
+            lambda after: self.book.iter_duplicates(field, after),
+            lambda item: f"{item[0]} {item[1]}",
+            options,
+            render=lambda item: f"{item[0]} {item[1]}: {', '.join(item[2])}",
+            empty="No shared phones or emails.",
+        )
 
     @input_error
     def delete_contact(self, args: List[str]) -> str:
         if not args:
             raise IndexError
         name = args[0]
+        self.find_record(name)
         self.book.delete(name)
         self.save_data()
         return f"Contact {name} deleted."
@@ -146,9 +460,7 @@ class Bot:
         if len(args) < 2:
             raise IndexError
         name, birthday = args[0], args[1]
-        record = self.book.find(name)
-        if not record:
-            raise KeyError(name)
+        record = self.find_record(name)
         record.add_birthday(birthday)
         self.save_data()
         return "Birthday added."
@@ -157,9 +469,7 @@ class Bot:
     def show_birthday(self, args: List[str]) -> str:
         if not args:
             raise IndexError
-        record = self.book.find(args[0])
-        if not record:
-            raise KeyError(args[0])
+        record = self.find_record(args[0])
         if not record.birthday:
             return f"{args[0]} has no birthday set."
         return f"{args[0]}'s birthday: {record.birthday}"
@@ -175,14 +485,37 @@ class Bot:
             for b in upcoming
         )
 
+    @input_error
+    def birthdays_in_month(self, args: List[str]) -> str:
+        if not args:
+            raise IndexError
+        birthdays = self.book.get_birthdays_in_month(int(args[0]))
+        if not birthdays:
+            return "No birthdays in this month."
+        return "\n".join(f"{b['name']}: {b['birthday']}" for b in birthdays)
+
+    @input_error
+    def birthdays_between(self, args: List[str]) -> str:
+        if len(args) < 2:
+            raise IndexError
+        try:
+            start, end = (datetime.strptime(arg, "%d.%m.%Y").date() for arg in args[:2])
+        except ValueError:
+            raise ValidationError("Invalid date format. Use DD.MM.YYYY")
+        birthdays = self.book.get_birthdays_between(start, end)
+        if not birthdays:
+            return "No birthdays in this period."
+        return "\n".join(
+            f"{b['name']}: {b['birthday']} (celebrate on {b['congratulation_date']})"
+            for b in birthdays
+        )
+
     @input_error
     def add_email(self, args: List[str]) -> str:
         if len(args) < 2:
             raise IndexError
         name, email = args[0], args[1]
-        record = self.book.find(name)
-        if not record:
-            raise KeyError(name)
+        record = self.find_record(name)
         record.add_email(email)
         self.save_data()
         return "Email added."
@@ -193,13 +526,36 @@ class Bot:
             raise IndexError
         name = args[0]
         address = " ".join(args[1:])
-        record = self.book.find(name)
-        if not record:
-            raise KeyError(name)
+        record = self.find_record(name)
         record.add_address(address)
         self.save_data()
         return "Address added."
 
+    @input_error
+    def import_contacts(self, args: List[str]) -> str:
+        if not args:
+            raise IndexError
+        fmt = args[1] if len(args) > 1 else None
+        report = self.book.import_from(args[0], fmt)
+        self.save_data()
+        lines = [str(report)]
+        lines.extend(f"  line {line}: {error}" for line, error in report.errors[:20])
+        if len(report.errors) > 20:
+            errors_file = f"{args[0]}.errors.txt"
+            with open(errors_file, "w", encoding="utf-8") as f:
+                for line, error in report.errors:
+                    f.write(f"line {line}: {error}\n")
+            lines.append(f"  ... and {len(report.errors) - 20} more, see {errors_file}")
+        return "\n".join(lines)
+
+    @input_error
+    def export_contacts(self, args: List[str]) -> str:
+        if not args:
+            raise IndexError
+        fmt = args[1] if len(args) > 1 else None
+        count = self.book.export_to(args[0], fmt)
+        return f"Exported {count} contacts to {args[0]}."
+
     @input_error
     def add_note(self, args: List[str]) -> str:
         if len(args) < 2:
@@ -214,22 +570,25 @@ class Bot:
     def show_note(self, args: List[str]) -> str:
         if not args:
             raise IndexError
-        note = self.notebook.find_note(args[0])
-        if not note:
-            raise KeyError(args[0])
+        note = self.find_note(args[0])
         return str(note)
 
     @input_error
-    def show_all_notes(self, _: List[str]) -> str:
-        notes = self.notebook.get_all_notes()
-        if not notes:
-            return "No notes saved."
-        return "\n\n".join(str(note) for note in notes)
+    def show_all_notes(self, args: List[str]) -> Page:
+        _, options = self.parse_page_args(args)
+        return self._page(
+            self.notebook.iter_notes,
+            lambda note: note.title,
+            options,
+            separator="\n\n",
+            empty="No notes saved.",
+        )
 
     @input_error
     def delete_note(self, args: List[str]) -> str:
         if not args:
             raise IndexError
+        self.find_note(args[0])
         self.notebook.delete_note(args[0])
         self.save_data()
         return "Note deleted."
@@ -240,6 +599,7 @@ class Bot:
             raise IndexError
         title = args[0]
         content = " ".join(args[1:])
+        self.find_note(title)
         self.notebook.update_note(title, content)
         self.save_data()
         return "Note updated."
@@ -249,6 +609,7 @@ class Bot:
         if len(args) < 2:
             raise IndexError
         title, tag = args[0], args[1]
+        self.find_note(title)
         self.notebook.add_tag(title, tag)
         self.save_data()
         return "Tag added."
@@ -258,29 +619,283 @@ class Bot:
         if len(args) < 2:
             raise IndexError
         title, tag = args[0], args[1]
+        self.find_note(title)
         self.notebook.remove_tag(title, tag)
         self.save_data()
         return "Tag removed."
 
     @input_error
-    def search_notes(self, args: List[str]) -> str:
+    def search_notes(self, args: List[str]) -> Union[Page, str]:
+        args, options = self.parse_page_args(args)
+        args, top = self.parse_top(args)
         if not args:
             raise IndexError
         query = " ".join(args)
-        notes = self.notebook.search_by_text(query)
-        if not notes:
-            return "No matching notes found."
-        return "\n\n".join(str(note) for note in notes)
+        if top is not None:
+            ranked = self.notebook.rank_by_text(query, top)
+            if not ranked:
+                return "No matching notes found."
+            return "\n\n".join(
+                f"{self.notebook.render(note.title)}\nRelevance: {score:.2f}"
+                for note, score in ranked
+            )
+        return self._page(
+            self.notebook.search_listing(query),
+            lambda title: title,
+            options,
+            render=self.notebook.render,
+            separator="\n\n",
+            empty="No matching notes found.",
+        )
+
+    @staticmethod
+    def parse_top(args: List[str]) -> Tuple[List[str], Optional[int]]:
+        rest, top = [], None
+        tokens = iter(args)
+        for token in tokens:
+            option, sep, value = token.partition("=")
+            if option != "--top":
+                rest.append(token)
+                continue
+            if not sep:
+                value = next(tokens, None)
+                if value is None:
+                    raise IndexError
+            if not value.isdigit() or int(value) == 0:
+                raise ValidationError("--top must be a positive number")
+            top = int(value)
+        return rest, top
 
     @input_error
-    def search_by_tags(self, args: List[str]) -> str:
+    def query_notes(self, args: List[str]) -> Union[Page, str]:
+        args, options = self.parse_page_args(args)
+        explain = "--explain" in args
+        args = [arg for arg in args if arg != "--explain"]
         if not args:
             raise IndexError
-        notes = self.notebook.search_by_tags(args)
+        query = " ".join(args)
+        if explain:
+            return self.notebook.plan_query(query).describe()
+        return self._page(
+            self.notebook.query_listing(query),
+            lambda title: title,
+            options,
+            render=self.notebook.render,
+            separator="\n\n",
+            empty="No matching notes found.",
+        )
+
+    @staticmethod
+    def parse_time_field(args: List[str]) -> Tuple[List[str], str]:
+        field = "created" if "--created" in args else "modified"
+        return [arg for arg in args if arg != "--created"], field
+
+    @input_error
+    def recent_notes(self, args: List[str]) -> str:
+        args, field = self.parse_time_field(args)
+        if args and not args[0].isdigit():
+            raise ValidationError("The number of notes must be a non-negative number")
+        notes = self.notebook.recent_notes(int(args[0]) if args else 10, field)
         if not notes:
-            return "No notes found with specified tags."
+            return "No notes saved."
         return "\n\n".join(str(note) for note in notes)
 
+    def _notes_between(
+        self, start: datetime, end: datetime, field: str, options: Dict[str, Any]
+    ) -> Page:
+        after = options.get("after")
+        if after is not None:
+            self.find_note(after)
+        # Pages continue from the time a note was shown at, so a note that
+        # was edited or deleted since still marks the place.
+        shown: Dict[str, datetime] = {}
+
+        def key(note: Note) -> str:
+            shown.clear()
+            shown[note.title] = getattr(note, f"{field}_at")
+            return note.title
+
+        return self._page(
+            lambda after: self.notebook.iter_notes_between(
+                start, end, field, after, shown.get(after)
+            ),
+            key,
+            options,
+            separator="\n\n",
+            empty="No notes in this period.",
+        )
+
+    @input_error
+    def notes_since(self, args: List[str]) -> Page:
+        args, options = self.parse_page_args(args)
+        args, field = self.parse_time_field(args)
+        if not args:
+            raise IndexError
+        return self._notes_between(parse_time(args[0]), datetime.max, field, options)
+
+    @input_error
+    def notes_between(self, args: List[str]) -> Page:
+        args, options = self.parse_page_args(args)
+        args, field = self.parse_time_field(args)
+        if len(args) < 2:
+            raise IndexError
+        start, end = parse_time(args[0]), parse_time(args[1])
+        if end < start:
+            raise ValidationError("The period ends before it starts")
+        # The last day is included.
+        return self._notes_between(start, end + timedelta(days=1), field, options)
+
+    def parse_tag_query(self, args: List[str]) -> List[TagClause]:
+        # NOT binds tighter than AND, and AND tighter than OR: the query is
+        # split into clauses at OR, and a note matches any of them.
+        clauses: List[List[str]] = [[]]
+        for token in args:
+            if token.upper() == "OR":
+                clauses.append([])
+            else:
+                clauses[-1].append(token)
+        if len(clauses) > 1 and not all(clauses):
+            raise ValidationError("OR needs a tag on both sides")
+        return [self.parse_tag_clause(tokens) for tokens in clauses]
+
+    @staticmethod
+    def parse_tag_clause(tokens: List[str]) -> TagClause:
+        # Within a clause AND (or +tag) requires a tag, NOT (or -tag) excludes
+        # it, and tags simply listed together match any of them.
+        all_of, any_of, none_of = [], [], []
+        operator = None
+        for i, token in enumerate(tokens):
+            upper = token.upper()
+            next_token = tokens[i + 1].upper() if i + 1 < len(tokens) else None
+            if upper in ("AND", "NOT"):
+                if next_token in (None, "AND"):
+                    raise ValidationError(f"{upper} needs a tag after it")
+                if upper == "AND" and (i == 0 or operator is not None):
+                    raise ValidationError("AND needs a tag on both sides")
+                operator = upper
+                continue
+            tag = token.lstrip("+-")
+            if not tag:
+                raise ValidationError(f"'{token}' has no tag name")
+            if token.startswith("-") or operator == "NOT":
+                none_of.append(tag)
+            elif token.startswith("+") or "AND" in (operator, next_token):
+                all_of.append(tag)
+            else:
+                any_of.append(tag)
+            operator = None
+        return all_of, any_of, none_of
+
+    @input_error
+    def search_by_tags(self, args: List[str]) -> Page:
+        args, options = self.parse_page_args(args)
+        if not args:
+            raise IndexError
+        return self._page(
+            self.notebook.tags_listing(self.parse_tag_query(args)),
+            lambda title: title,
+            options,
+            render=self.notebook.render,
+            separator="\n\n",
+            empty="No notes found with specified tags.",
+        )
+
+    @input_error
+    def show_tags(self, _: List[str]) -> str:
+        counts = self.notebook.tag_counts()
+        if not counts:
+            return "No tags used."
+        return "\n".join(f"{tag}: {count}" for tag, count in counts)
+
+    @input_error
+    def compact_notes(self, _: List[str]) -> str:
+        if self.blobs.threshold is None:
+            return "The blob store is off, start memok with --blob-threshold."
+        moved, removed = self.notebook.compact_blobs()
+        if moved:
+            self.save_data()
+        return (
+            f"Moved {moved} note bodies to the blob store, "
+            f"removed {removed} unused blobs."
+        )
+
+    @staticmethod
+    def _format_bytes(size: float) -> str:
+        for unit in ("B", "KB", "MB", "GB"):
+            if size < 1024 or unit == "GB":
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
+
+    @input_error
+    def show_stats(self, _: List[str]) -> str:
+        lines = ["Commands (count, p50, p95, max):"]
+        for labels, count, _, p50, p95, peak in COMMAND_SECONDS.summary():
+            command = dict(labels)["command"]
+            lines.append(
+                f"  {command:<18} {count:>7} {p50 * 1e3:9.2f} ms "
+                f"{p95 * 1e3:9.2f} ms {peak * 1e3:9.2f} ms"
+            )
+        errors = list(COMMAND_ERRORS.samples())
+        if errors:
+            lines.append("Errors:")
+            for _, labels, count in errors:
+                labels = dict(labels)
+                lines.append(f"  {labels['command']:<18} {labels['type']}: {count:.0f}")
+        for labels, _, total, _, _, _ in STARTUP_SECONDS.summary():
+            lines.append(f"Startup to {dict(labels)['stage']}: {total * 1e3:.2f} ms")
+        lines.append("Storage (count, total, max):")
+        for labels, count, total, _, _, peak in STORAGE_SECONDS.summary():
+            labels = dict(labels)
+            lines.append(
+                f"  {labels['op']:<7} {labels['store']:<18} {count:>7} "
+                f"{total * 1e3:9.2f} ms {peak * 1e3:9.2f} ms"
+            )
+        for title, counter in (("written", STORAGE_WRITTEN), ("read", STORAGE_READ)):
+            sizes = ", ".join(
+                f"{dict(labels)['target']} {self._format_bytes(value)}"
+                for _, labels, value in counter.samples()
+            )
+            lines.append(f"  {title}: {sizes or 'nothing'}")
+        objects = ", ".join(
+            f"{dict(labels)['kind'].replace('_', ' ')} {value:.0f}"
+            for _, labels, value in OBJECTS.samples()
+        )
+        lines.append(f"Objects: {objects}")
+        lookups: Dict[str, Dict[str, float]] = {}
+        for _, labels, value in CACHE_REQUESTS.samples():
+            labels = dict(labels)
+            lookups.setdefault(labels["cache"], {})[labels["result"]] = value
+        caches = ", ".join(
+            f"{cache.replace('_', ' ')} {counts.get('hit', 0):.0f}/"
+            f"{counts.get('miss', 0):.0f}"
+            for cache, counts in sorted(lookups.items())
+        )
+        lines.append(f"Caches (hits/misses): {caches or 'unused'}")
+        return "\n".join(lines)
+
+    @input_error
+    def dump_stats(self, args: List[str]) -> str:
+        filename = args[0] if args else "memok.prom"
+        METRICS.write(filename)
+        return f"Metrics written to {filename}."
+
+    @input_error
+    def profile_command(self, args: List[str]) -> str:
+        if not args:
+            raise IndexError
+        profiler = cProfile.Profile()
+        output = profiler.runcall(self.execute, " ".join(args))
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(20)
+        return f"{output}\n\n{report.getvalue().strip()}"
+
+    def is_mutating(self, user_input: str) -> bool:
+        command, args = self.parse_input(user_input)
+        if command == "profile":
+            return self.is_mutating(" ".join(args))
+        return command in self.MUTATING_COMMANDS
+
     def show_help(self, _: List[str]) -> str:
         return """Available commands:
     Contact Management:
@@ -288,13 +903,20 @@ class Bot:
     - change [name] [old phone] [new phone] - Change existing phone
     - phone [name] - Show contact's phones
     - all - Show all contacts
-    - find [query] - Search contacts
+    - find [query] - Search contacts (scope with name:, phone:, email:, address:)
+    - whois [phone|email] - Show the contacts with a phone number or email
+    - duplicates [phone|email] - Show phones and emails shared by several contacts
+    - next - Show the next page of the last listing
     - delete-contact [name] - Delete a contact
     - add-birthday [name] [DD.MM.YYYY] - Add birthday
     - show-birthday [name] - Show contact's birthday
     - birthdays [days] - Show upcoming birthdays
+    - birthdays-month [month] - Show birthdays in a month (1-12)
+    - birthdays-between [DD.MM.YYYY] [DD.MM.YYYY] - Show birthdays in a period
     - add-email [name] [email] - Add email
     - add-address [name] [address] - Add address
+    - import [file] [csv|jsonl|vcf] - Import contacts from a file
+    - export [file] [csv|jsonl|vcf] - Export contacts to a file
 
     Note Management:
     - add-note [title] [content] - Add a new note
@@ -305,31 +927,136 @@ class Bot:
     - add-tag [title] [tag] - Add a tag to a note
     - remove-tag [title] [tag] - Remove a tag from a note
     - search-notes [query] - Search notes by text
+      (--top K shows only the K most relevant notes, best first)
     - search-tags [tag1] [tag2] ... - Search notes by tags
+      (plain tags match any, +tag or AND requires, -tag or NOT excludes)
+    - query [expression] - Find notes matching tag:, text:, title:, created and
+      modified terms combined with AND, OR, NOT and parentheses, e.g.
+      tag:work AND text:"invoice" AND modified>2026-01-01 (--explain shows the plan)
+    - recent-notes [N] - Show the N most recently modified notes (10 by default)
+    - notes-since [date] - Show notes modified since a date, oldest first
+    - notes-between [date] [date] - Show notes modified in a period
+      (dates are YYYY-MM-DD or DD.MM.YYYY; add --created to use creation time)
+    - tags - Show all tags with their note counts
+    - compact-notes - Move large note bodies to the blob store, drop unused blobs
+
+    Listings (all, find, duplicates, all-notes, search-notes, search-tags, query,
+    notes-since, notes-between) accept --limit N, --offset N and --after [key] to
+    show one page at a time.
 
 
     Other Commands:
+    - stats - Show command latencies, errors and storage activity
+    - dump-stats [file] - Write the metrics in Prometheus text format
+    - profile [command] - Run a command under cProfile and show the hot spots
     - hello - Get a greeting
     - help - Show this help
     - exit/close - Exit the program"""
 
+    def dispatch(self, user_input: str) -> Union[str, Page]:
+        command, args = self.parse_input(user_input)
+        self.last_error = None
+        handler = self.commands.get(command)
+        if handler:
+            return handler(args)
+        self.last_error = KeyError(command)
+        closest = self.find_closest_command(user_input)
+        if closest:
+            return f"Command not found. Did you mean '{closest}'?"
+        return "Invalid command. Type 'help' for available commands."
+
+    def _observe(self, user_input: str, started: float) -> None:
+        command, _ = self.parse_input(user_input)
+        if command not in self.commands:
+            command = "unknown"
+        COMMAND_SECONDS.observe(time.perf_counter() - started, command=command)
+        if self.last_error is not None:
+            error = type(self.last_error).__name__
+            COMMAND_ERRORS.inc(command=command, type=error)
+
+    def _dispatch_in(
+        self, session: Optional[Session], user_input: str
+    ) -> Union[str, Page]:
+        self._local.session = session
+        try:
+            return self.dispatch(user_input)
+        finally:
+            self._local.session = None
+
+    def execute(self, user_input: str, session: Optional[Session] = None) -> str:
+        started = time.perf_counter()
+        try:
+            with self._locked():
+                if self.auto_refresh:
+                    self.refresh()
+                return str(self._dispatch_in(session, user_input))
+        finally:
+            self._observe(user_input, started)
+
+    def stream(
+        self, user_input: str, session: Optional[Session] = None
+    ) -> Iterator[str]:
+        # Listings are rendered while they are printed, so the first lines
+        # show up before the rest of the results have been read.
+        started = time.perf_counter()
+        try:
+            with self._locked():
+                if self.auto_refresh:
+                    self.refresh()
+                output = self._dispatch_in(session, user_input)
+                if isinstance(output, Page):
+                    yield from output
+                else:
+                    yield output
+        finally:
+            self._observe(user_input, started)
+
     def run(self) -> None:
         print("Welcome to the personal assistant! Type 'help' for commands.")
+        self.mark_started("prompt")
         while True:
-            user_input = input("Enter a command: ").strip()
-            command, args = self.parse_input(user_input)
+            try:
+                user_input = input("Enter a command: ").strip()
+            except EOFError:
+                user_input = "exit"
+            command, _ = self.parse_input(user_input)
 
             if command in ["close", "exit"]:
-                self.save_data()
+                self.close()
                 print("Good bye!")
                 break
 
-            handler = self.commands.get(command)
-            if handler:
-                print(handler(args))
-            else:
-                closest = self.find_closest_command(user_input)
-                if closest:
-                    print(f"Command not found. Did you mean '{closest}'?")
-                else:
-                    print("Invalid command. Type 'help' for available commands.")
+            for chunk in self.stream(user_input):
+                print(chunk)
+
+    def run_batch(
+        self, lines: Iterable[str], batch_size: int = 1000, quiet: bool = False
+    ) -> List[Tuple[int, str, str]]:
+        failures = []
+        executed = 0
+        self.autosave = False
+        try:
+            for line_no, line in enumerate(lines, 1):
+                user_input = line.strip()
+                if not user_input or user_input.startswith("#"):
+                    continue
+                command, _ = self.parse_input(user_input)
+                if command in ["close", "exit"]:
+                    break
+                output = self.execute(user_input)
+                executed += 1
+                if executed == 1:
+                    self.mark_started("first_command")
+                if self.last_error is not None:
+                    failures.append((line_no, user_input, output))
+                elif not quiet:
+                    print(output)
+                if self.pending_changes >= batch_size:
+                    self.flush()
+        finally:
+            self.autosave = True
+            self.close()
+        print(f"Executed {executed} commands, {len(failures)} failed.", file=sys.stderr)
+        for line_no, user_input, output in failures:
+            print(f"  line {line_no}: {user_input} -> {output}", file=sys.stderr)
+        return failures
@@ -0,0 +1,71 @@
+import json
+import socket
+import sys
+from typing import Iterable, Optional
+
+
+class Client:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        socket_path: Optional[str] = None,
+    ):
+        if socket_path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socket_path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.reader = self.socket.makefile("r", encoding="utf-8")
+        self.writer = self.socket.makefile("w", encoding="utf-8")
+
+    def execute(self, user_input: str) -> dict:
+        self.writer.write(user_input.strip() + "\n")
+        self.writer.flush()
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self.reader.close()
+        self.writer.close()
+        self.socket.close()
+
+    def run(self) -> None:
+        print("Connected to memok server. Type 'exit' to disconnect.")
+        while True:
+            try:
+                user_input = input("Enter a command: ").strip()
+            except EOFError:
+                break
+            if user_input.lower() in ["close", "exit"]:
+                break
+            if user_input:
+                try:
+                    print(self.execute(user_input)["output"])
+                except ConnectionError:
+                    print("The server closed the connection.", file=sys.stderr)
+                    return
+        print("Good bye!")
+
+    def run_batch(self, lines: Iterable[str]) -> int:
+        failures = 0
+        for line in lines:
+            user_input = line.strip()
+            if not user_input or user_input.startswith("#"):
+                continue
+            if user_input.split()[0].lower() in ["close", "exit"]:
+                break
+            try:
+                response = self.execute(user_input)
+            except ConnectionError:
+                # The command and the ones after it were not run.
+                print("The server closed the connection.", file=sys.stderr)
+                return failures + 1
+            if response["error"]:
+                failures += 1
+                print(response["output"], file=sys.stderr)
+            else:
+                print(response["output"])
+        return failures
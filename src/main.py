@@ -1,9 +1,131 @@
+import time
+
+# Taken before the heavier imports, so the startup time reported by 'stats'
+# includes loading memok's own modules.
+STARTED = time.perf_counter()
+
+import argparse
+import sys
 from src.bot import Bot
 
 
 def main():
-    bot = Bot()
-    bot.run()
+    parser = argparse.ArgumentParser(prog="memok", description="Memok assistant")
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["run", "serve", "connect"],
+        default="run",
+        help="run locally (default), serve commands to clients, or connect to a server",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="run commands from FILE ('-' for stdin) without prompting",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of changes persisted together in batch mode",
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="only report failures in batch mode"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["pickle", "sqlite"],
+        default="pickle",
+        help="storage backend for contacts and notes",
+    )
+    parser.add_argument(
+        "--database",
+        default="memok.db",
+        help="SQLite database file used with --storage sqlite",
+    )
+    parser.add_argument(
+        "--save-interval",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="save changes in the background at most this often (0 saves after "
+        "every command)",
+    )
+    parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="fsync every save, so saved changes also survive a power loss",
+    )
+    parser.add_argument(
+        "--blob-threshold",
+        type=int,
+        default=0,
+        metavar="BYTES",
+        help="keep note bodies of at least this size compressed on disk instead "
+        "of in memory (0 keeps them all in memory)",
+    )
+    parser.add_argument(
+        "--blob-codec",
+        choices=["zlib", "lzma"],
+        default="zlib",
+        help="compression for note bodies in the blob store",
+    )
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="load contacts and notes in the background at startup instead of on "
+        "first use",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="server host")
+    parser.add_argument("--port", type=int, default=8765, help="server port")
+    parser.add_argument(
+        "--socket", metavar="PATH", help="serve or connect on a Unix socket instead"
+    )
+    args = parser.parse_args()
+
+    if args.mode == "connect":
+        from src.client import Client
+
+        client = Client(args.host, args.port, args.socket)
+        try:
+            if args.batch is None and sys.stdin.isatty():
+                client.run()
+                return
+            if args.batch in (None, "-"):
+                failures = client.run_batch(sys.stdin)
+            else:
+                with open(args.batch, encoding="utf-8") as f:
+                    failures = client.run_batch(f)
+        finally:
+            client.close()
+        sys.exit(1 if failures else 0)
+
+    bot = Bot(
+        storage=args.storage,
+        database=args.database,
+        save_interval=args.save_interval,
+        fsync=args.fsync,
+        warm=args.warm,
+        started=STARTED,
+        blob_threshold=args.blob_threshold,
+        blob_codec=args.blob_codec,
+    )
+    if args.mode == "serve":
+        from src.server import serve
+
+        serve(bot, args.host, args.port, args.socket)
+        return
+
+    if args.batch is None and sys.stdin.isatty():
+        bot.run()
+        return
+
+    if args.batch in (None, "-"):
+        failures = bot.run_batch(sys.stdin, args.batch_size, args.quiet)
+    else:
+        with open(args.batch, encoding="utf-8") as f:
+            failures = bot.run_batch(f, args.batch_size, args.quiet)
+    sys.exit(1 if failures else 0)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,32 @@
-from datetime import datetime
-from typing import Optional, Set
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Sequence, Set
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
 
 
 class ValidationError(Exception):
     pass
 
 
+class ConflictError(Exception):
+    def __init__(self, key: str):
+        super().__init__(
+            f"'{key}' was changed by another memok process meanwhile; "
+            "the latest data was loaded, run the command again"
+        )
+        self.key = key
+
+
+class NotFoundError(KeyError):
+    def __init__(self, key: str, suggestions: Sequence[str] = ()):
+        super().__init__(key)
+        self.suggestions = list(suggestions)
+
+
 class Field:
+    __slots__ = ("_value",)
+
     def __init__(self, value: str):
         self.validate(value)
         self._value = value
@@ -26,14 +46,82 @@ class Field:
     def __str__(self) -> str:
         return str(self._value)
 
+    def __getstate__(self):
+        return (self._value,)
+
+    def __setstate__(self, state) -> None:
+        if isinstance(state, dict):
+            # Pickled before fields used __slots__.
+            state = (state["_value"],)
+        (self._value,) = state
+
+
+class BlobRef:
+    # A note body kept in a blob store, read each time it is needed.
+    __slots__ = ("digest", "store")
+
+    def __init__(self, digest: str, store=None):
+        self.digest = digest
+        self.store = store
+
+    def read(self) -> str:
+        if self.store is None:
+            raise ValidationError(f"Note body {self.digest} is in a closed blob store")
+        return self.store.get(self.digest)
+
 
 class Note:
+    FIELDS = (
+        ("title", False),
+        ("content", False),
+        ("tags", True),
+        ("created_at", False),
+        ("modified_at", False),
+        ("blob", False),
+    )
+    # Timestamps are kept as integer microseconds since the epoch.
+    __slots__ = ("title", "_content", "tags", "_created", "_modified")
+
     def __init__(self, title: str, content: str, tags: Set[str] = None):
         self.title = title
         self.content = content
         self.tags = tags or set()
         self.created_at = datetime.now()
-        self.modified_at = self.created_at
+        self._modified = self._created
+
+    @property
+    def content(self) -> str:
+        content = self._content
+        return content if isinstance(content, str) else content.read()
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+
+    @property
+    def blob(self) -> Optional[BlobRef]:
+        content = self._content
+        return content if isinstance(content, BlobRef) else None
+
+    def store_content(self, blob: BlobRef) -> None:
+        # The body now lives in a blob store and no longer takes memory.
+        self._content = blob
+
+    @property
+    def created_at(self) -> datetime:
+        return EPOCH + self._created * MICROSECOND
+
+    @created_at.setter
+    def created_at(self, value: datetime) -> None:
+        self._created = (value - EPOCH) // MICROSECOND
+
+    @property
+    def modified_at(self) -> datetime:
+        return EPOCH + self._modified * MICROSECOND
+
+    @modified_at.setter
+    def modified_at(self, value: datetime) -> None:
+        self._modified = (value - EPOCH) // MICROSECOND
 
     def add_tag(self, tag: str) -> None:
         self.tags.add(tag.lower())
@@ -47,6 +135,52 @@ class Note:
         self.content = content
         self.modified_at = datetime.now()
 
+    def to_dict(self) -> Dict[str, Any]:
+        blob = self.blob
+        return {
+            "title": self.title,
+            "content": "" if blob else self._content,
+            "tags": sorted(self.tags),
+            "created_at": self.created_at.isoformat(),
+            "modified_at": self.modified_at.isoformat(),
+            "blob": blob.digest if blob else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Note":
+        note = cls(data["title"], data["content"] or "", set(data.get("tags") or []))
+        if data.get("blob"):
+            note.store_content(BlobRef(data["blob"]))
+        if data.get("created_at"):
+            note.created_at = datetime.fromisoformat(data["created_at"])
+        note.modified_at = (
+            datetime.fromisoformat(data["modified_at"])
+            if data.get("modified_at")
+            else note.created_at
+        )
+        return note
+
+    def copy(self) -> "Note":
+        note = Note.__new__(Note)
+        note.title = self.title
+        note._content = self._content
+        note.tags = set(self.tags)
+        note._created = self._created
+        note._modified = self._modified
+        return note
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state) -> None:
+        if "created_at" in state:
+            # Pickled before notes used __slots__.
+            state = dict(state)
+            self.created_at = state.pop("created_at")
+            self.modified_at = state.pop("modified_at")
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __str__(self) -> str:
         tags_str = ", ".join(sorted(self.tags)) if self.tags else "No tags"
         return (
@@ -1,10 +1,17 @@
-from collections import UserList
-from datetime import datetime
+from array import array
+from collections.abc import MutableSequence
+from datetime import date
 import re
+from typing import Iterable, Iterator
 from .base import Field, ValidationError
 
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+DATE_PATTERN = re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})$")
+
 
 class Name(Field):
+    __slots__ = ()
+
     def validate(self, value: str):
         if not value or not value.strip():
             raise ValidationError("Name cannot be empty")
@@ -13,48 +20,110 @@ class Name(Field):
 
 
 class Email(Field):
+    __slots__ = ()
+
     def validate(self, value: str):
-        pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        if not re.match(pattern, value):
+        if not EMAIL_PATTERN.match(value):
             raise ValidationError("Invalid email format")
 
 
 class Address(Field):
+    __slots__ = ()
+
     def validate(self, value: str):
         if not value or not value.strip():
             raise ValidationError("Address cannot be empty")
 
 
-class PhoneList(UserList):
+class PhoneList(MutableSequence):
+    # Phones are packed as 64-bit integers; Phone objects are created on access.
+    __slots__ = ("_numbers",)
+
+    def __init__(self, phones: Iterable["Phone"] = ()):
+        self._numbers = array("Q", (int(p.value) for p in phones))
+
+    def __getitem__(self, index: int) -> "Phone":
+        return Phone.from_number(self._numbers[index])
+
+    def __setitem__(self, index: int, phone: "Phone") -> None:
+        self._numbers[index] = int(phone.value)
+
+    def __delitem__(self, index: int) -> None:
+        del self._numbers[index]
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __iter__(self) -> Iterator["Phone"]:
+        return map(Phone.from_number, self._numbers)
+
+    def insert(self, index: int, phone: "Phone") -> None:
+        self._numbers.insert(index, int(phone.value))
+
+    def find(self, digits: str) -> int:
+        if len(digits) != 10:
+            return -1
+        try:
+            return self._numbers.index(int(digits))
+        except ValueError:
+            return -1
+
     def __str__(self) -> str:
-        return f"{'; '.join(p.value for p in self.data)}"
+        return "; ".join(f"{number:010d}" for number in self._numbers)
+
+    def __getstate__(self):
+        return (self._numbers,)
+
+    def __setstate__(self, state) -> None:
+        if isinstance(state, dict):
+            # Pickled when PhoneList was a UserList of Phone objects.
+            numbers = (int(Phone.normalize_phone(p.value)) for p in state["data"])
+            state = (array("Q", numbers),)
+        (self._numbers,) = state
 
 
 class Phone(Field):
+    __slots__ = ()
+
+    def __init__(self, value: str):
+        super().__init__(value)
+        self._value = self.normalize_phone(value)
+
     def validate(self, value: str):
         digits = "".join(filter(str.isdigit, value))
         if len(digits) != 10:
             raise ValidationError("Phone number must contain exactly 10 digits")
         self._value = digits
 
+    @classmethod
+    def from_number(cls, number: int) -> "Phone":
+        phone = cls.__new__(cls)
+        phone._value = f"{number:010d}"
+        return phone
+
     @staticmethod
     def normalize_phone(phone: str) -> str:
         return "".join(filter(str.isdigit, phone))
 
 
 class Birthday(Field):
+    __slots__ = ()
+
     def __init__(self, value: str):
         self.validate(value)
-        self._value = datetime.strptime(value, "%d.%m.%Y").date()
 
     def validate(self, value: str):
+        match = DATE_PATTERN.match(value)
         try:
-            date = datetime.strptime(value, "%d.%m.%Y").date()
-            if date > datetime.now().date():
-                raise ValidationError("Birthday cannot be in the future")
-            self._value = date
+            if not match:
+                raise ValueError(value)
+            day, month, year = map(int, match.groups())
+            birthday = date(year, month, day)
         except ValueError:
             raise ValidationError("Invalid date format. Use DD.MM.YYYY")
+        if birthday > date.today():
+            raise ValidationError("Birthday cannot be in the future")
+        self._value = birthday
 
     def __str__(self) -> str:
         return self._value.strftime("%d.%m.%Y")
@@ -0,0 +1,175 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import json
+import signal
+from typing import Optional, Tuple
+from .bot import Bot, Session
+
+# Longest command line accepted, in bytes; asyncio's default is 64 KB.
+LINE_LIMIT = 1 << 20
+
+
+class ReadWriteLock:
+    # Writer-preferring: once a writer waits, new readers queue behind it.
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writing and not self._waiting_writers
+            )
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            await self._condition.wait_for(
+                lambda: not self._writing and not self._readers
+            )
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class BotServer:
+    def __init__(self, bot: Bot, workers: int = 8):
+        self.bot = bot
+        self.lock = ReadWriteLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.clients = 0
+        # Refreshing changes the stores, so it is done under the write lock
+        # instead of by each command.
+        self.bot.auto_refresh = False
+
+    def _execute(self, user_input: str, session: Session) -> Tuple[str, bool]:
+        output = self.bot.execute(user_input, session)
+        return output, self.bot.last_error is not None
+
+    async def execute(
+        self, user_input: str, session: Optional[Session] = None
+    ) -> Tuple[str, bool]:
+        loop = asyncio.get_running_loop()
+        if self.bot.is_stale():
+            async with self.lock.write():
+                await loop.run_in_executor(self.executor, self.bot.refresh)
+        lock = (
+            self.lock.write() if self.bot.is_mutating(user_input) else self.lock.read()
+        )
+        async with lock:
+            return await loop.run_in_executor(
+                self.executor, self._execute, user_input, session
+            )
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+        # Returns b"" at the end of the stream, and None for a line over the
+        # limit, which is skipped up to its end so the next one reads whole.
+        skipped = False
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                line = e.partial
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+                skipped = True
+                continue
+            return None if skipped else line
+
+    async def _reply(
+        self, writer: asyncio.StreamWriter, output: str, error: bool
+    ) -> None:
+        response = {"output": output, "error": error}
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.clients += 1
+        # Each connection pages through its own listings.
+        session = Session()
+        try:
+            while True:
+                line = await self._read_line(reader)
+                if line is None:
+                    await self._reply(
+                        writer, f"Command longer than {LINE_LIMIT} bytes.", True
+                    )
+                    continue
+                if not line:
+                    break
+                try:
+                    user_input = line.decode("utf-8").strip()
+                except UnicodeDecodeError:
+                    await self._reply(writer, "Command is not valid UTF-8.", True)
+                    continue
+                if not user_input:
+                    continue
+                command, _ = self.bot.parse_input(user_input)
+                if command in ["close", "exit"]:
+                    break
+                output, error = await self.execute(user_input, session)
+                await self._reply(writer, output, error)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # The server is stopping; the connection is closed below.
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def serve(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        socket_path: Optional[str] = None,
+    ) -> None:
+        if socket_path:
+            server = await asyncio.start_unix_server(
+                self.handle_client, socket_path, limit=LINE_LIMIT
+            )
+            address = socket_path
+        else:
+            server = await asyncio.start_server(
+                self.handle_client, host, port, limit=LINE_LIMIT
+            )
+            address = f"{host}:{port}"
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        print(f"Serving memok on {address}")
+        self.bot.mark_started("listening")
+        async with server:
+            await stop.wait()
+        async with self.lock.write():
+            self.executor.shutdown(wait=True)
+            self.bot.close()
+        print("Server stopped.")
+
+
+def serve(bot: Bot, host: str, port: int, socket_path: Optional[str] = None) -> None:
+    asyncio.run(BotServer(bot).serve(host, port, socket_path))
@@ -0,0 +1,723 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections.abc import ItemsView, MutableMapping, ValuesView
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+from ..models.base import ConflictError
+from .filelock import FileLock
+from .journal import Journal, journal_path
+from .metrics import STORAGE_READ, STORAGE_SECONDS, STORAGE_WRITTEN, file_size
+from .snapshot import (
+    Schema,
+    Snapshot,
+    SnapshotMapping,
+    is_snapshot,
+    read_generation,
+    write_snapshot,
+)
+
+Factory = Callable[[Dict[str, Any]], Any]
+Adopt = Callable[[Any], None]
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def load(self, adopt: Optional[Adopt] = None) -> MutableMapping:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def save(self, data: Mapping[str, Any]) -> None:
+        pass
+
+    def commit(self, data: Mapping[str, Any]) -> None:
+        pass
+
+    def background_commit(self, data: Mapping[str, Any], lock) -> None:
+        # Called off the main thread; `lock` guards data and the backend
+        # against the commands that change them.
+        with lock:
+            self.commit(data)
+
+    def set_durability(self, fsync: bool) -> None:
+        pass
+
+    @contextmanager
+    def bulk(self, data: Mapping[str, Any]):
+        try:
+            yield
+        finally:
+            self.commit(data)
+
+    def close(self) -> None:
+        pass
+
+
+def file_identity(filename: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class SnapshotBackend(StorageBackend):
+    # Several processes can share the files. Appends and snapshot swaps hold
+    # an exclusive lock on <filename>.lock, loading and catching up a shared
+    # one. Each snapshot carries a generation: a process that finds a newer
+    # one reloads, otherwise it only reads the journal entries added since
+    # it last looked.
+    def __init__(
+        self,
+        filename: str,
+        factory: Factory,
+        schema: Schema,
+        compact_threshold: int = 1000,
+    ):
+        self.filename = filename
+        self.factory = factory
+        self.schema = schema
+        self.compact_threshold = compact_threshold
+        self.journal = Journal(journal_path(filename))
+        self.lock = FileLock(f"{filename}.lock")
+        self.mapping: Optional[SnapshotMapping] = None
+        self.adopt: Optional[Adopt] = None
+        self.generation = 0
+        self.identity: Optional[Tuple[int, int, int]] = None
+        # Keys changed by other processes that the store was not told about.
+        self.changed: Set[str] = set()
+        self.reloaded = False
+        self.in_bulk = False
+        self.bulk_keys: Set[str] = set()
+        # Held while a snapshot file is written and swapped in.
+        self.writing = threading.Lock()
+
+    def _migrate_pickle(self) -> None:
+        # Files written before the snapshot format are pickled dicts; they
+        # are read once and rewritten as a snapshot. The snapshot is written
+        # to a new file first and the pickle is kept as <file>.bak, so a
+        # failed or unwanted conversion loses nothing.
+        with open(self.filename, "rb") as f:
+            data = pickle.load(f)
+        for entry in self.journal.replay():
+            if entry["op"] == "put":
+                data[entry["key"]] = self.factory(entry["value"])
+            else:
+                data.pop(entry["key"], None)
+        new_filename = f"{self.filename}.{os.getpid()}.new"
+        with self.writing:
+            items = ((key, item.to_dict()) for key, item in data.items())
+            with STORAGE_SECONDS.time(op="save", store=self.store):
+                write_snapshot(new_filename, self.schema, items, self.generation + 1)
+            shutil.copy2(self.filename, f"{self.filename}.bak")
+            os.replace(new_filename, self.filename)
+        STORAGE_WRITTEN.inc(file_size(self.filename), target="snapshot")
+        # Replaying the journal again would change nothing, so a crash
+        # before it is reset is harmless.
+        self.journal.reset()
+
+    @property
+    def store(self) -> str:
+        return os.path.basename(self.filename)
+
+    def load(self, adopt: Optional[Adopt] = None) -> MutableMapping:
+        self.adopt = adopt
+        with STORAGE_SECONDS.time(op="load", store=self.store):
+            if os.path.exists(self.filename) and not is_snapshot(self.filename):
+                with self.lock.exclusive():
+                    if not is_snapshot(self.filename):
+                        self._migrate_pickle()
+            with self.lock.shared():
+                self._open()
+        return self.mapping
+
+    def _open(self) -> None:
+        snapshot = None
+        self.identity = file_identity(self.filename)
+        if self.identity is not None:
+            snapshot = Snapshot(self.filename)
+            STORAGE_READ.inc(file_size(self.filename), target="snapshot")
+        self.generation = snapshot.generation if snapshot is not None else 0
+        self.mapping = SnapshotMapping(snapshot, self.factory, self.adopt)
+        self._apply(self.journal.replay())
+
+    def _apply(self, entries: Iterator[Dict[str, Any]]) -> Set[str]:
+        keys = set()
+        for entry in entries:
+            key = entry["key"]
+            if entry["op"] == "put":
+                self.mapping[key] = self.mapping.materialize(entry["value"])
+            elif key in self.mapping:
+                del self.mapping[key]
+            keys.add(key)
+        return keys
+
+    def _snapshot_replaced(self) -> bool:
+        identity = file_identity(self.filename)
+        if identity == self.identity:
+            return False
+        if read_generation(self.filename) == self.generation and identity:
+            # Touched or copied in place, but the same data.
+            self.identity = identity
+            return False
+        return True
+
+    def _journal_replaced(self) -> bool:
+        stat = self.journal.stat()
+        if self.journal.inode is None:
+            return False
+        return stat is None or stat[0] != self.journal.inode
+
+    def _catch_up(self) -> Optional[Set[str]]:
+        # Needs the lock. Returns the keys other processes changed, or None
+        # when a new snapshot was loaded. The old mapping is left open for
+        # the store, which switches over on its next refresh.
+        if self._snapshot_replaced() or self._journal_replaced():
+            self.journal.close()
+            self._open()
+            self.reloaded = True
+            self.changed.clear()
+            return None
+        keys = self._apply(self.journal.read())
+        self.changed |= keys
+        return keys
+
+    def stale(self) -> bool:
+        if self.mapping is None:
+            return False
+        if self.reloaded or self.changed:
+            return True
+        if file_identity(self.filename) != self.identity:
+            return True
+        stat = self.journal.stat()
+        if stat is None:
+            return self.journal.inode is not None
+        return stat != (self.journal.inode, self.journal.position)
+
+    def refresh(self) -> Optional[Set[str]]:
+        if self.mapping is None:
+            return set()
+        if self.stale():
+            with self.lock.shared():
+                self._catch_up()
+        if self.reloaded:
+            self.reloaded = False
+            return None
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def _write(self, op: str, key: str, value: Optional[Dict[str, Any]] = None):
+        if self.in_bulk:
+            self.bulk_keys.add(key)
+            return
+        with self.lock.exclusive():
+            # The change was made on the state last caught up with; if another
+            # process wrote the same key since, that state is refreshed and
+            # the change refused instead of overwriting theirs.
+            changed = self._catch_up()
+            if changed is None or key in changed:
+                raise ConflictError(key)
+            self.journal.drop_torn_tail()
+            self.journal.append(op, key, value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self._write("put", key, value)
+
+    def delete(self, key: str) -> None:
+        self._write("delete", key)
+
+    @contextmanager
+    def bulk(self, data: Mapping[str, Any]):
+        # Bulk changes skip the journal and end with a single new snapshot.
+        self.in_bulk = True
+        self.bulk_keys = set()
+        try:
+            yield
+        finally:
+            self.in_bulk = False
+            self.save(data)
+            self.bulk_keys = set()
+
+    def save(self, data: Mapping[str, Any]) -> None:
+        with self.writing, self.lock.exclusive():
+            if data is self.mapping:
+                data = self._merge_bulk()
+            if isinstance(data, SnapshotMapping):
+                items = data.iter_dicts()
+            else:
+                items = ((key, item.to_dict()) for key, item in data.items())
+            generation = max(self.generation, read_generation(self.filename)) + 1
+            with STORAGE_SECONDS.time(op="save", store=self.store):
+                write_snapshot(self.filename, self.schema, items, generation)
+            STORAGE_WRITTEN.inc(file_size(self.filename), target="snapshot")
+            self.journal.reset()
+            if data is self.mapping:
+                self.mapping.rebase(Snapshot(self.filename))
+                self.generation = generation
+                self.identity = file_identity(self.filename)
+
+    def _merge_bulk(self) -> SnapshotMapping:
+        # Writing the whole state: first take in what other processes wrote,
+        # keeping the bulk changes, which never went to the journal.
+        mapping = self.mapping
+        pending = {
+            key: mapping[key] if key in mapping else None for key in self.bulk_keys
+        }
+        self._catch_up()
+        for key, item in pending.items():
+            if item is not None:
+                self.mapping[key] = item
+            elif key in self.mapping:
+                del self.mapping[key]
+        return self.mapping
+
+    def _current(self, data: Mapping[str, Any]) -> Mapping[str, Any]:
+        # After a reload the store keeps the previous mapping until its next
+        # refresh; writing that one out would undo the other processes' work.
+        return self.mapping if isinstance(data, SnapshotMapping) else data
+
+    def commit(self, data: Mapping[str, Any]) -> None:
+        if self.journal.entries >= self.compact_threshold:
+            self.save(self._current(data))
+        else:
+            with STORAGE_SECONDS.time(op="commit", store=self.store):
+                self.journal.flush()
+
+    def background_commit(self, data: Mapping[str, Any], lock) -> None:
+        # Compaction writes the snapshot without holding the lock: the changes
+        # are captured first, and the journal keeps every entry until the new
+        # snapshot is in place. Entries hold full states, so replaying those
+        # the snapshot already contains is harmless.
+        with lock:
+            if self.journal.entries < self.compact_threshold:
+                self.commit(data)
+                return
+            data = self._current(data)
+            if data is not self.mapping:
+                self.save(data)
+                return
+            with self.lock.shared():
+                self._catch_up()
+                offset, entries = self.journal.position, self.journal.entries
+                base, changes, deleted = self.mapping.capture()
+                generation = self.generation
+        new_filename = f"{self.filename}.{os.getpid()}.new"
+        with self.writing:
+            if self.mapping.snapshot is not base:
+                return
+            items = SnapshotMapping.captured_items(base, changes, deleted)
+            with STORAGE_SECONDS.time(op="compact", store=self.store):
+                write_snapshot(new_filename, self.schema, items, generation + 1)
+        with lock, self.lock.exclusive():
+            self._catch_up()
+            # A save in the meantime, here or in another process, wrote a
+            # newer snapshot and reset the journal itself.
+            if self.mapping.snapshot is not base or self.generation != generation:
+                os.remove(new_filename)
+                return
+            os.replace(new_filename, self.filename)
+            STORAGE_WRITTEN.inc(file_size(self.filename), target="snapshot")
+            self.mapping.swap(Snapshot(self.filename), changes, deleted)
+            self.journal.discard_before(offset, entries)
+            self.generation = generation + 1
+            self.identity = file_identity(self.filename)
+
+    def background_save(
+        self, capture: Callable[[], Mapping[str, Any]], lock: Callable
+    ) -> None:
+        # For stores that keep their own frozen copies of the state. capture()
+        # runs under the store's lock, lock(), while other processes are held
+        # off, and returns a state holding every journal entry so far. That
+        # is written out without either lock; entries appended meanwhile stay
+        # in the journal, as in background_commit.
+        with lock(), self.lock.shared():
+            data = capture()
+            offset, entries = self.journal.position, self.journal.entries
+            generation = self.generation
+        new_filename = f"{self.filename}.{os.getpid()}.new"
+        with self.writing:
+            items = ((key, item.to_dict()) for key, item in data.items())
+            with STORAGE_SECONDS.time(op="save", store=self.store):
+                write_snapshot(new_filename, self.schema, items, generation + 1)
+        with lock(), self.lock.exclusive():
+            self._catch_up()
+            if self.generation != generation:
+                # Another process saved in the meantime and reset the journal.
+                os.remove(new_filename)
+                return
+            os.replace(new_filename, self.filename)
+            STORAGE_WRITTEN.inc(file_size(self.filename), target="snapshot")
+            if self.mapping is not None:
+                self.mapping.swap(Snapshot(self.filename), {}, set())
+            self.journal.discard_before(offset, entries)
+            self.generation = generation + 1
+            self.identity = file_identity(self.filename)
+
+    def set_durability(self, fsync: bool) -> None:
+        self.journal.fsync = fsync
+
+    def close(self) -> None:
+        self.journal.close()
+        self.lock.close()
+        if self.mapping is not None:
+            self.mapping.close()
+
+
+class SqliteDatabase:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            name TEXT PRIMARY KEY,
+            birthday TEXT,
+            email TEXT,
+            address TEXT
+        );
+        CREATE TABLE IF NOT EXISTS phones (
+            name TEXT NOT NULL REFERENCES records (name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            PRIMARY KEY (name, position)
+        );
+        CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+        CREATE INDEX IF NOT EXISTS records_email ON records (email);
+        CREATE TABLE IF NOT EXISTS notes (
+            title TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            modified_at TEXT NOT NULL,
+            blob TEXT
+        );
+        CREATE INDEX IF NOT EXISTS notes_modified_at ON notes (modified_at);
+        CREATE TABLE IF NOT EXISTS note_tags (
+            title TEXT NOT NULL REFERENCES notes (title) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (title, tag)
+        );
+        CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag);
+    """
+
+    def __init__(self, filename: str = "memok.db"):
+        self.filename = filename
+        # Server mode runs commands on worker threads, one at a time for writes.
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(self.SCHEMA)
+        # Databases created before note bodies could live in a blob store.
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(notes)")
+        }
+        if "blob" not in columns:
+            self.connection.execute("ALTER TABLE notes ADD COLUMN blob TEXT")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class SqliteBackend(StorageBackend):
+    table = ""
+    key_column = ""
+
+    def __init__(
+        self,
+        database: SqliteDatabase,
+        factory: Factory,
+        cache_size: int = 10000,
+        chunk_size: int = 500,
+    ):
+        self.database = database
+        self.connection = database.connection
+        self.factory = factory
+        self.cache_size = cache_size
+        self.chunk_size = chunk_size
+        self.mapping: Optional[SqliteMapping] = None
+        self.data_version = 0
+
+    def load(self, adopt: Optional[Adopt] = None) -> MutableMapping:
+        self.mapping = SqliteMapping(self, adopt)
+        self.data_version = self._data_version()
+        return self.mapping
+
+    def _data_version(self) -> int:
+        # Changes whenever another connection commits to the database.
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def stale(self) -> bool:
+        return self.mapping is not None and self._data_version() != self.data_version
+
+    def refresh(self) -> Optional[Set[str]]:
+        if not self.stale():
+            return set()
+        # SQLite keeps the rows consistent; only cached items may be out of date.
+        self.data_version = self._data_version()
+        self.mapping.cache.clear()
+        return None
+
+    def count(self) -> int:
+        sql = f"SELECT COUNT(*) FROM {self.table}"
+        return self.connection.execute(sql).fetchone()[0]
+
+    def exists(self, key: str) -> bool:
+        sql = f"SELECT 1 FROM {self.table} WHERE {self.key_column} = ?"
+        return self.connection.execute(sql, (key,)).fetchone() is not None
+
+    def keys(self) -> List[str]:
+        sql = f"SELECT {self.key_column} FROM {self.table} ORDER BY {self.key_column}"
+        return [row[0] for row in self.connection.execute(sql)]
+
+    def delete(self, key: str) -> None:
+        sql = f"DELETE FROM {self.table} WHERE {self.key_column} = ?"
+        self.connection.execute(sql, (key,))
+
+    def save(self, data: Mapping[str, Any]) -> None:
+        if getattr(data, "backend", None) is self:
+            self.commit(data)
+            return
+        with STORAGE_SECONDS.time(op="save", store=self.table), self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+            for key, item in data.items():
+                self.put(key, item.to_dict())
+
+    def commit(self, data: Mapping[str, Any]) -> None:
+        with STORAGE_SECONDS.time(op="commit", store=self.table):
+            self.connection.commit()
+
+    def set_durability(self, fsync: bool) -> None:
+        mode = "FULL" if fsync else "NORMAL"
+        self.connection.execute(f"PRAGMA synchronous={mode}")
+
+    def migrate_from(self, backend: StorageBackend) -> None:
+        if self.count() == 0:
+            self.save(backend.load())
+
+    def fetch(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.fetch_many([key]).get(key)
+
+    def fetch_all(self, after: str = "") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # Keyset pagination keeps only one chunk of rows in memory and stays
+        # correct if the caller writes to the table while iterating.
+        sql = (
+            f"SELECT {self.key_column} FROM {self.table}"
+            f" WHERE {self.key_column} > ? ORDER BY {self.key_column} LIMIT ?"
+        )
+        last = after
+        while True:
+            rows = self.connection.execute(sql, (last, self.chunk_size)).fetchall()
+            if not rows:
+                return
+            keys = [row[0] for row in rows]
+            values = self.fetch_many(keys)
+            for key in keys:
+                if key in values:
+                    yield key, values[key]
+            last = keys[-1]
+
+    @staticmethod
+    def _placeholders(keys: List[str]) -> str:
+        return ", ".join("?" * len(keys))
+
+    @abstractmethod
+    def fetch_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        pass
+
+
+class SqliteContactBackend(SqliteBackend):
+    table = "records"
+    key_column = "name"
+
+    def fetch_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = self._placeholders(keys)
+        phones: Dict[str, List[str]] = {}
+        for name, phone in self.connection.execute(
+            f"SELECT name, phone FROM phones WHERE name IN ({placeholders})"
+            " ORDER BY name, position",
+            keys,
+        ):
+            phones.setdefault(name, []).append(phone)
+        return {
+            row[0]: self._row_to_dict(row, phones.get(row[0], []))
+            for row in self.connection.execute(
+                "SELECT name, birthday, email, address FROM records"
+                f" WHERE name IN ({placeholders})",
+                keys,
+            )
+        }
+
+    @staticmethod
+    def _row_to_dict(row: Tuple, phones: List[str]) -> Dict[str, Any]:
+        name, birthday, email, address = row
+        return {
+            "name": name,
+            "phones": phones,
+            "birthday": birthday,
+            "email": email,
+            "address": address,
+        }
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.connection.execute(
+            "INSERT INTO records (name, birthday, email, address) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET birthday = excluded.birthday,"
+            " email = excluded.email, address = excluded.address",
+            (key, value.get("birthday"), value.get("email"), value.get("address")),
+        )
+        self.connection.execute("DELETE FROM phones WHERE name = ?", (key,))
+        self.connection.executemany(
+            "INSERT INTO phones (name, position, phone) VALUES (?, ?, ?)",
+            [(key, i, phone) for i, phone in enumerate(value.get("phones") or [])],
+        )
+
+
+class SqliteNoteBackend(SqliteBackend):
+    table = "notes"
+    key_column = "title"
+
+    def fetch_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = self._placeholders(keys)
+        tags: Dict[str, List[str]] = {}
+        for title, tag in self.connection.execute(
+            f"SELECT title, tag FROM note_tags WHERE title IN ({placeholders})"
+            " ORDER BY title, tag",
+            keys,
+        ):
+            tags.setdefault(title, []).append(tag)
+        return {
+            row[0]: self._row_to_dict(row, tags.get(row[0], []))
+            for row in self.connection.execute(
+                "SELECT title, content, created_at, modified_at, blob FROM notes"
+                f" WHERE title IN ({placeholders})",
+                keys,
+            )
+        }
+
+    @staticmethod
+    def _row_to_dict(row: Tuple, tags: List[str]) -> Dict[str, Any]:
+        title, content, created_at, modified_at, blob = row
+        return {
+            "title": title,
+            "content": content,
+            "tags": tags,
+            "created_at": created_at,
+            "modified_at": modified_at,
+            "blob": blob,
+        }
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.connection.execute(
+            "INSERT INTO notes (title, content, created_at, modified_at, blob)"
+            " VALUES (?, ?, ?, ?, ?) ON CONFLICT (title) DO UPDATE SET"
+            " content = excluded.content, created_at = excluded.created_at,"
+            " modified_at = excluded.modified_at, blob = excluded.blob",
+            (
+                key,
+                value["content"] or "",
+                value["created_at"],
+                value["modified_at"],
+                value.get("blob"),
+            ),
+        )
+        self.connection.execute("DELETE FROM note_tags WHERE title = ?", (key,))
+        self.connection.executemany(
+            "INSERT INTO note_tags (title, tag) VALUES (?, ?)",
+            [(key, tag) for tag in value.get("tags") or []],
+        )
+
+
+class SqliteMapping(MutableMapping):
+    # Items are materialized on access and kept in a bounded cache. Writes to
+    # the database go through the backend, so evicting a cached item is safe.
+    def __init__(self, backend: SqliteBackend, adopt: Optional[Adopt] = None):
+        self.backend = backend
+        self.adopt = adopt
+        self.cache: "OrderedDict[str, Any]" = OrderedDict()
+
+    def _materialize(self, key: str, value: Dict[str, Any]) -> Any:
+        item = self.cache.get(key)
+        if item is not None:
+            return item
+        item = self.backend.factory(value)
+        if self.adopt is not None:
+            self.adopt(item)
+        self._cache(key, item)
+        return item
+
+    def _cache(self, key: str, item: Any) -> None:
+        self.cache[key] = item
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.backend.cache_size:
+            self.cache.popitem(last=False)
+
+    def __getitem__(self, key: str) -> Any:
+        item = self.cache.get(key)
+        if item is not None:
+            self.cache.move_to_end(key)
+            return item
+        value = self.backend.fetch(key)
+        if value is None:
+            raise KeyError(key)
+        return self._materialize(key, value)
+
+    def __setitem__(self, key: str, item: Any) -> None:
+        self._cache(key, item)
+
+    def __delitem__(self, key: str) -> None:
+        if self.cache.pop(key, None) is None and not self.backend.exists(key):
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.cache or self.backend.exists(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.backend.keys())
+
+    def __len__(self) -> int:
+        return self.backend.count()
+
+    def values(self) -> ValuesView:
+        return SqliteValuesView(self)
+
+    def items(self) -> ItemsView:
+        return SqliteItemsView(self)
+
+    def iter_items(self, after: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        for key, value in self.backend.fetch_all(after or ""):
+            yield key, self._materialize(key, value)
+
+    def iter_dicts(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # Rows are written as soon as an item changes, so they are current.
+        return self.backend.fetch_all(after or "")
+
+
+class SqliteValuesView(ValuesView):
+    def __iter__(self):
+        for _, item in self._mapping.iter_items():
+            yield item
+
+
+class SqliteItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
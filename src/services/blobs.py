@@ -0,0 +1,97 @@
+import hashlib
+import lzma
+import os
+import time
+from typing import Iterable, Iterator, Optional
+import zlib
+from ..models.base import BlobRef, ValidationError
+from .metrics import STORAGE_READ, STORAGE_WRITTEN
+
+# Each blob starts with a byte naming its codec, so a store can hold blobs
+# written with different settings.
+CODECS = {
+    "zlib": (b"z", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (b"x", lzma.compress, lzma.decompress),
+}
+DECODERS = {tag: decompress for tag, _, decompress in CODECS.values()}
+
+
+class BlobStore:
+    # Content-addressed: a blob is named by the SHA-256 of its text, so equal
+    # note bodies are stored once and a blob never changes after it is written.
+    def __init__(
+        self, directory: str, threshold: Optional[int] = None, codec: str = "zlib"
+    ):
+        if codec not in CODECS:
+            raise ValidationError(f"Unknown blob codec: {codec}")
+        self.directory = directory
+        # Bodies of at least this many bytes are stored; None only reads.
+        self.threshold = threshold
+        self.codec = codec
+        self.fsync = False
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def should_store(self, text: str) -> bool:
+        if self.threshold is None or len(text) * 4 < self.threshold:
+            return False
+        return len(text.encode("utf-8")) >= self.threshold
+
+    def put(self, text: str) -> BlobRef:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        try:
+            # Marks the blob as in use again, see collect().
+            os.utime(path)
+        except FileNotFoundError:
+            tag, compress, _ = CODECS[self.codec]
+            encoded = tag + compress(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            STORAGE_WRITTEN.inc(len(encoded), target="blobs")
+        return BlobRef(digest, self)
+
+    def get(self, digest: str) -> str:
+        try:
+            with open(self.path(digest), "rb") as f:
+                encoded = f.read()
+        except FileNotFoundError:
+            raise ValidationError(f"Note body {digest} is missing from the blob store")
+        STORAGE_READ.inc(len(encoded), target="blobs")
+        decompress = DECODERS.get(encoded[:1])
+        if decompress is None:
+            raise ValidationError(f"Note body {digest} has an unknown codec")
+        return decompress(encoded[1:]).decode("utf-8")
+
+    def digests(self) -> Iterator[str]:
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in sorted(os.listdir(self.directory)):
+            folder = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if not name.endswith(".tmp"):
+                    yield prefix + name
+
+    def collect(self, live: Iterable[str], grace: float = 600.0) -> int:
+        # Removes the blobs no note refers to any more. Blobs written or
+        # reused within the grace period are kept: another memok process may
+        # be about to save a note that refers to one.
+        live = set(live)
+        cutoff = time.time() - grace
+        removed = 0
+        for digest in list(self.digests()):
+            path = self.path(digest)
+            if digest not in live and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
@@ -0,0 +1,157 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import islice
+import threading
+from typing import Any, Callable, Hashable, Iterator, List, Optional
+from .metrics import CACHE_REQUESTS
+from .paging import Source
+
+MISSING = object()
+
+# Default bounds of a store's caches: keys of cached listings in all, which
+# are shared with the store and cost a list slot each, and rendered contacts
+# or notes.
+RESULTS_SIZE = 100000
+RENDERED_SIZE = 4096
+# Cached listings are weighed in steps of this many keys.
+GROWTH = 256
+
+
+class LRUCache:
+    # A bounded cache whose entries remember the store generation they were
+    # computed at. Every change to a store bumps its generation, so entries
+    # from before the change turn into misses, and are dropped by the first
+    # entry computed after it. maxsize bounds the total weight of the
+    # entries, e.g. listed keys.
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable, generation: int) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                result = "hit"
+            else:
+                self.misses += 1
+                result = "miss"
+        CACHE_REQUESTS.inc(cache=self.name, result=result)
+        return entry[1] if result == "hit" else MISSING
+
+    def put(self, key: Hashable, generation: int, value: Any, weight: int = 1) -> None:
+        if weight > self.maxsize:
+            return
+        with self.lock:
+            if generation < self.generation:
+                return
+            if generation > self.generation:
+                self.generation = generation
+                self.entries.clear()
+                self.weight = 0
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.weight -= old[2]
+            self.entries[key] = (generation, value, weight)
+            self.weight += weight
+            while self.weight > self.maxsize:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.weight -= evicted
+
+    def lookup(self, key: Hashable, generation: int, compute: Callable[[], Any]) -> Any:
+        value = self.get(key, generation)
+        if value is MISSING:
+            value = compute()
+            self.put(key, generation, value)
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+
+
+class CachedKeys:
+    # The keys of a listing read so far, in order, and the rest of the
+    # listing, which is read only as pages need it.
+    __slots__ = ("keys", "rest", "lock")
+
+    def __init__(self, rest: Iterator[str]):
+        self.keys: List[str] = []
+        self.rest: Optional[Iterator[str]] = rest
+        self.lock = threading.Lock()
+
+    def key_at(self, position: int, limit: int) -> Any:
+        # The key at a position, None past the end of the listing, or MISSING
+        # when more than limit keys would have to be kept.
+        with self.lock:
+            if position < len(self.keys):
+                return self.keys[position]
+            if self.rest is None:
+                return None
+            if position >= limit:
+                return MISSING
+            key = next(self.rest, None)
+            if key is None:
+                self.rest = None
+            else:
+                self.keys.append(key)
+            return key
+
+
+def cached_listing(
+    cache: LRUCache,
+    key: Hashable,
+    generation: Callable[[], int],
+    source: Source,
+    item_key: Callable[[Any], str],
+) -> Source:
+    # Returns a source of item keys in key order. The keys are kept for the
+    # generation they were read at as pages read them, so a later page or
+    # the same query again reads no further than before; pages asked for
+    # after a change, or past the size of the cache, read the store.
+    read_at = generation()
+    listing = cache.get(key, read_at)
+    if listing is MISSING:
+        # Reading starts here, so a bad query fails before any output.
+        listing = CachedKeys(item_key(item) for item in source(None))
+        cache.put(key, read_at, listing, GROWTH)
+
+    def live(after: Optional[str]) -> Iterator[str]:
+        return (item_key(item) for item in source(after))
+
+    def cached(position: int) -> Iterator[str]:
+        while generation() == read_at:
+            found = listing.key_at(position, cache.maxsize - 1)
+            if found is None:
+                return
+            if found is MISSING:
+                break
+            position += 1
+            if position == len(listing.keys) and position % GROWTH == 0:
+                weight = min(position + GROWTH, cache.maxsize)
+                cache.put(key, read_at, listing, weight)
+            yield found
+        yield from live(listing.keys[position - 1] if position else None)
+
+    def keys_after(after: Optional[str]) -> Iterator[str]:
+        if generation() != read_at:
+            return live(after)
+        keys = listing.keys
+        if after is not None and listing.rest is not None:
+            if not keys or after > keys[-1]:
+                # Beyond what was read: the store finds it faster.
+                return live(after)
+        return cached(0 if after is None else bisect_right(keys, after))
+
+    return keys_after
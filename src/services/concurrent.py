@@ -0,0 +1,413 @@
+from collections.abc import Mapping
+from contextlib import contextmanager
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import weakref
+from ..models.base import Note
+from .backends import SnapshotBackend, StorageBackend
+from .notebook import NoteBook
+from .paging import Source, iter_sorted
+from .record import Record
+from .rwlock import ReadWriteLock
+from .storage import AddressBook
+
+
+class DataSnapshot(Mapping):
+    # A read-only view of a store at one moment. The store never changes the
+    # dictionary behind a live snapshot: its next write copies it first.
+    __slots__ = ("data", "__weakref__")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    # Iterators refer to the snapshot rather than to its dictionary, so it
+    # stays alive, and keeps writers off the dictionary, until they finish.
+    def __iter__(self) -> Iterator[str]:
+        yield from self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def iter_items(self, after: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        yield from iter_sorted(self.data, after)
+
+
+class SnapshotGuard:
+    # Hands out one snapshot per version of a store's dictionary and tells
+    # writers whether that version is still being read. Only then does a
+    # write copy the dictionary, so writes without readers cost nothing more.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Optional[weakref.ref] = None
+        self.copies = 0
+
+    def snapshot(self, data: Dict[str, Any]) -> DataSnapshot:
+        with self._lock:
+            view = self._current() if self._current is not None else None
+            if view is None or view.data is not data:
+                view = DataSnapshot(data)
+                self._current = weakref.ref(view)
+            return view
+
+    def writable(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Called by writers only, under the store's write lock.
+        with self._lock:
+            view = self._current() if self._current is not None else None
+            self._current = None
+        if view is None or view.data is not data:
+            return data
+        self.copies += 1
+        return dict(data)
+
+
+def compaction_due(backend: StorageBackend) -> bool:
+    # Journal entries are only added under the store's write lock, so while
+    # the read lock is held a commit below the threshold stays a flush.
+    return (
+        isinstance(backend, SnapshotBackend)
+        and backend.journal.entries >= backend.compact_threshold
+    )
+
+
+class ConcurrentAddressBook(AddressBook):
+    # An address book threads can share. Changes take the write lock.
+    # Listings, exports and saves read a snapshot without holding any lock;
+    # index lookups (search, owners, birthdays) hold the read lock instead,
+    # as the indexes follow the live data. Stored records are never changed
+    # in place: find() returns a private copy, and each change to it is made
+    # on the stored version under the write lock and stored as a new copy.
+    # Records from listings belong to the book and must not be changed.
+    # Everything is kept in memory, also when opened from a backend.
+    def __init__(self, *args, **kwargs):
+        self.lock = ReadWriteLock()
+        self.views = SnapshotGuard()
+        super().__init__(*args, **kwargs)
+
+    def snapshot(self) -> DataSnapshot:
+        with self.lock.read():
+            return self.views.snapshot(self.data)
+
+    def _writable(self) -> None:
+        self.data = self.views.writable(self.data)
+
+    def _private(self, record: Record) -> Record:
+        copy = record.copy()
+        copy._book = self
+        return copy
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        with self.lock.write():
+            record._book = self
+            self.record_changed(record)
+
+    def __getitem__(self, name: str) -> Record:
+        with self.lock.read():
+            return self._private(self.data[name])
+
+    def __delitem__(self, name: str) -> None:
+        with self.lock.write():
+            self._writable()
+            super().__delitem__(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.snapshot())
+
+    @contextmanager
+    def editing(self, record: Record):
+        # The copy is brought up to date first, so a change made through an
+        # older copy does not undo changes stored since.
+        with self.lock.write():
+            current = self.data.get(record.name.value)
+            if current is not None:
+                record.update_from(current)
+            yield
+            self.record_changed(record)
+
+    def record_changed(self, record: Record) -> None:
+        with self.lock.write():
+            self._writable()
+            super().record_changed(self._private(record))
+
+    def refresh(self) -> None:
+        with self.lock.write():
+            if self.backend is None:
+                return
+            changed = self.backend.refresh()
+            if changed is not None and not changed:
+                return
+            self._writable()
+            mapping = self.backend.mapping
+            if changed is None:
+                self.data = dict(mapping.items())
+                self._reset_indexes()
+                return
+            for name in changed:
+                record = mapping.get(name)
+                if record is None:
+                    self.data.pop(name, None)
+                    self._unindex(name)
+                else:
+                    self.data[name] = record
+                    self._reindex(record)
+
+    def open(self, backend: StorageBackend) -> None:
+        with self.lock.write():
+            super().open(backend)
+            self.data = dict(self.data.items())
+
+    @contextmanager
+    def bulk(self):
+        with self.lock.write():
+            self._writable()
+            with super().bulk():
+                yield
+
+    def delete(self, name: str) -> None:
+        with self.lock.write():
+            super().delete(name)
+
+    def find(self, name: str) -> Optional[Record]:
+        with self.lock.read():
+            record = self.data.get(name)
+            return None if record is None else self._private(record)
+
+    def iter_records(self, after: Optional[str] = None) -> Iterator[Record]:
+        for _, record in self.snapshot().iter_items(after):
+            yield record
+
+    def iter_search(
+        self, query: str, field: Optional[str] = None, after: Optional[str] = None
+    ) -> Iterator[Record]:
+        with self.lock.read():
+            return iter(list(super().iter_search(query, field, after)))
+
+    def iter_duplicates(
+        self, field: Optional[str] = None, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, str, List[str]]]:
+        with self.lock.read():
+            return iter(list(super().iter_duplicates(field, after)))
+
+    def find_owners(self, value: str) -> List[Record]:
+        with self.lock.read():
+            return super().find_owners(value)
+
+    def suggest(self, name: str, n: int = 1) -> List[str]:
+        with self.lock.read():
+            return super().suggest(name, n)
+
+    def get_upcoming_birthdays(self, days: int = 7) -> List[Dict]:
+        with self.lock.read():
+            return super().get_upcoming_birthdays(days)
+
+    def get_birthdays_between(self, start, end) -> List[Dict]:
+        with self.lock.read():
+            return super().get_birthdays_between(start, end)
+
+    def get_birthdays_in_month(self, month: int) -> List[Dict]:
+        with self.lock.read():
+            return super().get_birthdays_in_month(month)
+
+    def render(self, name: str) -> str:
+        with self.lock.read():
+            return super().render(name)
+
+    def _capture(self) -> DataSnapshot:
+        # The saved state replaces the journal, so it takes in the changes
+        # other processes wrote there first.
+        self.refresh()
+        return self.views.snapshot(self.data)
+
+    def commit(self, lock=None) -> None:
+        # Compaction writes the snapshot without holding up writers.
+        if self.backend is None:
+            return
+        with self.lock.read():
+            if not compaction_due(self.backend):
+                self.backend.commit(self.snapshot())
+                return
+        self.backend.background_save(self._capture, self.lock.write)
+
+    def save_to_file(self, filename: str = "addressbook.pkl") -> None:
+        backend = self.backend
+        if isinstance(backend, SnapshotBackend) and backend.filename == filename:
+            backend.background_save(self._capture, self.lock.write)
+            return
+        SnapshotBackend(filename, Record.from_dict, Record.FIELDS).save(self.snapshot())
+
+
+class ConcurrentNoteBook(NoteBook):
+    # A notebook threads can share, on the same terms as ConcurrentAddressBook.
+    # Notes are changed through the notebook's methods, which store a changed
+    # copy; notes it hands out must not be changed.
+    def __init__(self):
+        self.lock = ReadWriteLock()
+        self.views = SnapshotGuard()
+        super().__init__()
+
+    def snapshot(self) -> DataSnapshot:
+        with self.lock.read():
+            return self.views.snapshot(self.notes)
+
+    def _writable(self) -> None:
+        self.notes = self.views.writable(self.notes)
+
+    def _editable(self, title: str) -> Note:
+        if title not in self.notes:
+            raise KeyError(f"Note '{title}' not found")
+        return self.notes[title].copy()
+
+    def _note_changed(self, note: Note) -> None:
+        with self.lock.write():
+            self._writable()
+            super()._note_changed(note.copy())
+
+    def add_note(
+        self, title: str, content: str, tags: Optional[List[str]] = None
+    ) -> None:
+        with self.lock.write():
+            self._writable()
+            super().add_note(title, content, tags)
+
+    def update_note(self, title: str, content: str) -> None:
+        with self.lock.write():
+            note = self._editable(title)
+            note.update_content(content)
+            self._note_changed(note)
+
+    def add_tag(self, title: str, tag: str) -> None:
+        with self.lock.write():
+            note = self._editable(title)
+            note.add_tag(tag)
+            self._note_changed(note)
+
+    def remove_tag(self, title: str, tag: str) -> None:
+        with self.lock.write():
+            note = self._editable(title)
+            note.remove_tag(tag)
+            self._note_changed(note)
+
+    def delete_note(self, title: str) -> None:
+        with self.lock.write():
+            self._writable()
+            super().delete_note(title)
+
+    def compact_blobs(self) -> Tuple[int, int]:
+        # Moved bodies end up in the stored copies, so the blobs still in use
+        # are read from those.
+        with self.lock.write():
+            if self.blobs is None:
+                return 0, 0
+            moved = 0
+            for note in list(self.notes.values()):
+                if note.blob is None and self.blobs.should_store(note.content):
+                    self._note_changed(note)
+                    moved += 1
+            live = {
+                note.blob.digest
+                for note in self.notes.values()
+                if note.blob is not None
+            }
+            return moved, self.blobs.collect(live)
+
+    def refresh(self) -> None:
+        with self.lock.write():
+            if self.backend is None:
+                return
+            changed = self.backend.refresh()
+            if changed is not None and not changed:
+                return
+            self._writable()
+            mapping = self.backend.mapping
+            if changed is None:
+                self.notes = dict(mapping.items())
+                self._reset_indexes()
+                return
+            for title in changed:
+                note = mapping.get(title)
+                if note is None:
+                    self.notes.pop(title, None)
+                    self._unindex(title)
+                else:
+                    self.notes[title] = note
+                    self._reindex(note)
+
+    def open(self, backend: StorageBackend) -> None:
+        with self.lock.write():
+            super().open(backend)
+            self.notes = dict(self.notes.items())
+
+    def iter_notes(self, after: Optional[str] = None) -> Iterator[Note]:
+        for _, note in self.snapshot().iter_items(after):
+            yield note
+
+    def _read_all(self, source: Source, after: Optional[str] = None) -> Iterator:
+        with self.lock.read():
+            return iter(list(source(after)))
+
+    def _listing(self, key: Tuple, source: Source) -> Source:
+        return super()._listing(key, lambda after: self._read_all(source, after))
+
+    def iter_tag_clauses(self, clauses, after=None):
+        parent = super().iter_tag_clauses
+        return self._read_all(lambda after: parent(clauses, after), after)
+
+    def iter_search_by_text(
+        self, query: str, after: Optional[str] = None
+    ) -> Iterator[Note]:
+        parent = super().iter_search_by_text
+        return self._read_all(lambda after: parent(query, after), after)
+
+    def iter_notes_between(
+        self, start, end, field="modified", after=None, after_time=None
+    ):
+        parent = super().iter_notes_between
+        return self._read_all(
+            lambda after: parent(start, end, field, after, after_time), after
+        )
+
+    def query(self, query: str) -> List[Note]:
+        with self.lock.read():
+            return super().query(query)
+
+    def tag_counts(self) -> List[Tuple[str, int]]:
+        with self.lock.read():
+            return super().tag_counts()
+
+    def suggest(self, title: str, n: int = 1) -> List[str]:
+        with self.lock.read():
+            return super().suggest(title, n)
+
+    def recent_notes(self, n: int, field: str = "modified") -> List[Note]:
+        with self.lock.read():
+            return super().recent_notes(n, field)
+
+    def rank_by_text(self, query: str, k: int) -> List[Tuple[Note, float]]:
+        with self.lock.read():
+            return super().rank_by_text(query, k)
+
+    def render(self, title: str) -> str:
+        with self.lock.read():
+            return super().render(title)
+
+    def _capture(self) -> DataSnapshot:
+        self.refresh()
+        return self.views.snapshot(self.notes)
+
+    def commit(self, lock=None) -> None:
+        if self.backend is None:
+            return
+        with self.lock.read():
+            if not compaction_due(self.backend):
+                self.backend.commit(self.snapshot())
+                return
+        self.backend.background_save(self._capture, self.lock.write)
+
+    def save_to_file(self, filename: str = "notebook.pkl") -> None:
+        backend = self.backend
+        if isinstance(backend, SnapshotBackend) and backend.filename == filename:
+            backend.background_save(self._capture, self.lock.write)
+            return
+        SnapshotBackend(filename, Note.from_dict, Note.FIELDS).save(self.snapshot())
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are kept apart.
+    fcntl = None
+
+
+class FileLock:
+    # An advisory lock shared by every memok process using the same store.
+    # flock() does not keep threads of one process apart, so a thread lock is
+    # taken as well; nested use from the holding thread keeps the outer mode.
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _acquire(self, operation) -> None:
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth > 1 or fcntl is None:
+            return
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, operation)
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    @contextmanager
+    def shared(self):
+        self._acquire(fcntl.LOCK_SH if fcntl is not None else None)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def exclusive(self):
+        self._acquire(fcntl.LOCK_EX if fcntl is not None else None)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def close(self) -> None:
+        with self._thread_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
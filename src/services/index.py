@@ -0,0 +1,585 @@
+from bisect import bisect_left, bisect_right, insort
+from calendar import isleap
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from heapq import merge, nlargest, nsmallest
+from math import log
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+class TrigramIndex:
+    def __init__(self, n: int = 3):
+        self.n = n
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        self.grams: Dict[str, Set[str]] = {}
+        # Keys with a text shorter than n have no grams for it, so they stay
+        # candidates for every query that is itself shorter than n.
+        self.short: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.grams)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.grams
+
+    def ngrams(self, text: str) -> Set[str]:
+        n = self.n
+        return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, key: str, texts: Iterable[str]) -> None:
+        if key in self.grams:
+            self.remove(key)
+        grams: Set[str] = set()
+        for text in texts:
+            text = text.lower()
+            if len(text) < self.n:
+                self.short.add(key)
+            grams |= self.ngrams(text)
+        self.grams[key] = grams
+        for gram in grams:
+            self.postings[gram].add(key)
+
+    def remove(self, key: str) -> None:
+        for gram in self.grams.pop(key, ()):
+            posting = self.postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self.postings[gram]
+        self.short.discard(key)
+
+    def estimate(self, query: str) -> int:
+        # An upper bound of len(candidates(query)) that costs one lookup per
+        # gram of the query.
+        query = query.lower()
+        if len(query) < self.n:
+            return len(self)
+        return min(len(self.postings.get(gram, ())) for gram in self.ngrams(query))
+
+    def candidates(self, query: str) -> Set[str]:
+        query = query.lower()
+        if len(query) < self.n:
+            result = set(self.short)
+            for gram, posting in self.postings.items():
+                if query in gram:
+                    result |= posting
+            return result
+        postings = []
+        for gram in self.ngrams(query):
+            posting = self.postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # Optimal string alignment distance (adjacent swaps count as one edit).
+    # Returns limit + 1 as soon as the distance is known to exceed limit.
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(row[j] + 1, current[j - 1] + 1, row[j - 1] + cost)
+            if (
+                previous is not None
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous, row = row, current
+    return min(row[-1], limit + 1)
+
+
+class SuggestionIndex:
+    # Finds keys within a few edits of a misspelled word. Keys are indexed by
+    # the trigrams of their padded lower-case form. One edit (a swap of two
+    # letters included) changes at most n + 1 grams, so a key within k edits
+    # shares all but (n + 1) * k grams with the word and contains at least
+    # one of any (n + 1) * k + 1 of them; only keys found in the rarest ones
+    # are counted, and only those sharing enough grams are verified.
+    PAD = "\0"
+    # Words too short for the gram filter are compared with every key, but
+    # only while that stays cheap.
+    SCAN_LIMIT = 10000
+
+    def __init__(self, keys: Iterable[str] = (), n: int = 3):
+        self.n = n
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        self.keys: Set[str] = set()
+        for key in keys:
+            self.add(key)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def ngrams(self, word: str) -> Set[str]:
+        n = self.n
+        padded = f"{self.PAD * (n - 1)}{word.lower()}{self.PAD * (n - 1)}"
+        return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+    def add(self, key: str) -> None:
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        for gram in self.ngrams(key):
+            self.postings[gram].add(key)
+
+    def remove(self, key: str) -> None:
+        if key not in self.keys:
+            return
+        self.keys.discard(key)
+        for gram in self.ngrams(key):
+            posting = self.postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self.postings[gram]
+
+    def suggest(
+        self, word: str, n: int = 1, max_distance: Optional[int] = None
+    ) -> List[str]:
+        if max_distance is None:
+            max_distance = self.max_distance(word)
+        # Closer matches are looked for first, as the wider search is slower.
+        for distance in range(1, max_distance + 1):
+            matches = self._within(word, distance)
+            if matches:
+                return [key for _, key in sorted(matches)[:n]]
+        return []
+
+    @staticmethod
+    def max_distance(word: str) -> int:
+        return 1 if len(word) <= 6 else 2
+
+    @classmethod
+    def scan(cls, keys: Iterable[str], word: str, n: int = 1) -> List[str]:
+        # Suggests without an index, for keys looked at once: a single pass
+        # finds the matches at every distance, and like suggest() it keeps
+        # those within the smallest distance that has any.
+        matches = sorted(close_matches(word.lower(), keys, cls.max_distance(word)))
+        if not matches:
+            return []
+        limit = max(matches[0][0], 1)
+        return [key for distance, key in matches[:n] if distance <= limit]
+
+    def _within(self, word: str, limit: int) -> List[Tuple[int, str]]:
+        word = word.lower()
+        grams = self.ngrams(word)
+        spread = (self.n + 1) * limit
+        if len(grams) <= spread:
+            if len(self.keys) > self.SCAN_LIMIT:
+                return []
+            candidates: Iterable[str] = self.keys
+            shared = 0
+        else:
+            rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+            candidates = set()
+            for gram in rarest[: spread + 1]:
+                candidates |= self.postings.get(gram, set())
+            shared = len(grams) - spread
+        if shared:
+            candidates = [
+                key
+                for key in candidates
+                if abs(len(key) - len(word)) <= limit
+                and len(grams & self.ngrams(key)) >= shared
+            ]
+        return close_matches(word, candidates, limit)
+
+
+def close_matches(word: str, keys: Iterable[str], limit: int) -> List[Tuple[int, str]]:
+    # (distance, key) for the keys within limit edits of the lower-case word.
+    letters = Counter(word)
+    matches = []
+    for key in keys:
+        if abs(len(key) - len(word)) > limit:
+            continue
+        # Letters that only one side has each need an edit, which is a much
+        # cheaper bound than the distance itself.
+        lowered = key.lower()
+        remaining = dict(letters)
+        extra = 0
+        for letter in lowered:
+            if remaining.get(letter):
+                remaining[letter] -= 1
+            else:
+                extra += 1
+        if max(extra, extra - len(lowered) + len(word)) > limit:
+            continue
+        distance = edit_distance(word, lowered, limit)
+        if distance <= limit:
+            matches.append((distance, key))
+    return matches
+
+
+def intersect_sorted(postings: Sequence[List[str]]) -> List[str]:
+    if not postings:
+        return []
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for posting in postings[1:]:
+        narrowed = []
+        lo = 0
+        for key in result:
+            lo = bisect_left(posting, key, lo)
+            if lo == len(posting):
+                break
+            if posting[lo] == key:
+                narrowed.append(key)
+        result = narrowed
+        if not result:
+            break
+    return list(result)
+
+
+def union_sorted(postings: Sequence[List[str]]) -> List[str]:
+    result: List[str] = []
+    for key in merge(*postings):
+        if not result or result[-1] != key:
+            result.append(key)
+    return result
+
+
+def difference_sorted(posting: List[str], excluded: List[str]) -> List[str]:
+    result = []
+    lo = 0
+    for key in posting:
+        lo = bisect_left(excluded, key, lo)
+        if lo == len(excluded) or excluded[lo] != key:
+            result.append(key)
+    return result
+
+
+class PostingIndex:
+    def __init__(self):
+        self.postings: Dict[str, List[str]] = {}
+        self.terms: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def add(self, key: str, terms: Iterable[str]) -> None:
+        terms = set(terms)
+        old_terms = self.terms.get(key, set())
+        for term in old_terms - terms:
+            self._discard(term, key)
+        for term in terms - old_terms:
+            insort(self.postings.setdefault(term, []), key)
+        self.terms[key] = terms
+
+    def remove(self, key: str) -> None:
+        for term in self.terms.pop(key, ()):
+            self._discard(term, key)
+
+    def _discard(self, term: str, key: str) -> None:
+        posting = self.postings[term]
+        i = bisect_left(posting, key)
+        if i < len(posting) and posting[i] == key:
+            del posting[i]
+        if not posting:
+            del self.postings[term]
+
+    def get(self, term: str) -> List[str]:
+        return self.postings.get(term, [])
+
+    def keys(self) -> List[str]:
+        return sorted(self.terms)
+
+    def counts(self) -> List[Tuple[str, int]]:
+        return sorted(
+            ((term, len(posting)) for term, posting in self.postings.items()),
+            key=lambda item: (-item[1], item[0]),
+        )
+
+    def query(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+    ) -> List[str]:
+        all_of, any_of, none_of = list(all_of), list(any_of), list(none_of)
+        required = [self.get(term) for term in all_of]
+        if any_of:
+            required.append(union_sorted([self.get(term) for term in any_of]))
+        result = intersect_sorted(required) if required else self.keys()
+        if none_of and result:
+            result = difference_sorted(
+                result, union_sorted([self.get(term) for term in none_of])
+            )
+        return result
+
+    def query_any(
+        self, clauses: Iterable[Tuple[List[str], List[str], List[str]]]
+    ) -> List[str]:
+        # Keys matching any of the (all_of, any_of, none_of) clauses.
+        results = [self.query(*clause) for clause in clauses]
+        return results[0] if len(results) == 1 else union_sorted(results)
+
+
+class ExactIndex:
+    # Maps exact values (normalized phones, lowercased emails) to the keys
+    # holding them, and keeps track of values held by more than one key.
+    def __init__(self):
+        self.owners: Dict[str, Set[str]] = {}
+        self.values: Dict[str, Tuple[str, ...]] = {}
+        self.shared: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def add(self, key: str, values: Iterable[str]) -> None:
+        values = tuple(dict.fromkeys(values))
+        if self.values.get(key, ()) == values:
+            return
+        self.remove(key)
+        if values:
+            self.values[key] = values
+        for value in values:
+            owners = self.owners.setdefault(value, set())
+            owners.add(key)
+            if len(owners) > 1:
+                self.shared.add(value)
+
+    def remove(self, key: str) -> None:
+        for value in self.values.pop(key, ()):
+            owners = self.owners[value]
+            owners.discard(key)
+            if not owners:
+                del self.owners[value]
+            elif len(owners) == 1:
+                self.shared.discard(value)
+
+    def get(self, value: str) -> Set[str]:
+        return self.owners.get(value, set())
+
+    def duplicates(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, List[str]]]:
+        values = sorted(v for v in self.shared if after is None or v > after)
+        for value in values:
+            yield value, sorted(self.owners[value])
+
+
+class RankIndex:
+    # BM25 statistics over note titles and bodies. A word in the title counts
+    # as TITLE_BOOST words of the body, as in BM25F, so title matches rank
+    # higher. Kept up to date per note, so nothing is recounted on a search.
+    K1 = 1.2
+    B = 0.75
+    TITLE_BOOST = 2.0
+    WORD = re.compile(r"\w+")
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.lengths: Dict[str, float] = {}
+        self.words: Dict[str, Tuple[str, ...]] = {}
+        self.total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.WORD.findall(text.lower())
+
+    def add(self, key: str, title: str, body: str) -> None:
+        self.remove(key)
+        frequencies: Dict[str, float] = Counter(self.tokenize(body))
+        for word in self.tokenize(title):
+            frequencies[word] += self.TITLE_BOOST
+        length = sum(frequencies.values())
+        self.lengths[key] = length
+        self.total_length += length
+        self.words[key] = tuple(frequencies)
+        for word, frequency in frequencies.items():
+            self.postings.setdefault(word, {})[key] = frequency
+
+    def remove(self, key: str) -> None:
+        length = self.lengths.pop(key, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for word in self.words.pop(key):
+            posting = self.postings[word]
+            del posting[key]
+            if not posting:
+                del self.postings[word]
+
+    def idf(self, word: str) -> float:
+        found = len(self.postings.get(word, ()))
+        return log(1 + (len(self.lengths) - found + 0.5) / (found + 0.5))
+
+    def top(self, query: str, k: int) -> List[Tuple[str, float]]:
+        # Words are scored rarest first. Once the k-th best score beats what
+        # the remaining words could add, no unseen key can enter the top k:
+        # only keys already scored are updated, and those that can no longer
+        # reach the top k are dropped.
+        words = [word for word in set(self.tokenize(query)) if word in self.postings]
+        if not words or k <= 0:
+            return []
+        idfs = {word: self.idf(word) for word in words}
+        words.sort(key=lambda word: -idfs[word])
+        bounds = [idfs[word] * (self.K1 + 1) for word in words]
+        remaining = [sum(bounds[i:]) for i in range(len(words))]
+        average = self.total_length / len(self.lengths)
+        scores: Dict[str, float] = {}
+        for i, word in enumerate(words):
+            posting = self.postings[word]
+            admit = True
+            if len(scores) >= k:
+                threshold = nlargest(k, scores.values())[-1]
+                if threshold > remaining[i]:
+                    admit = False
+                    scores = {
+                        key: score
+                        for key, score in scores.items()
+                        if score + remaining[i] >= threshold
+                    }
+            if admit or len(posting) <= len(scores):
+                keys = posting
+            else:
+                keys = [key for key in scores if key in posting]
+            idf = idfs[word]
+            for key in keys:
+                if not admit and key not in scores:
+                    continue
+                frequency = posting[key]
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[key] / average)
+                gain = idf * frequency * (self.K1 + 1) / (frequency + norm)
+                scores[key] = scores.get(key, 0.0) + gain
+        return nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class TimeIndex:
+    # Entries are (timestamp, key) pairs in time order, so a time range or
+    # the latest keys are found with a binary search instead of a sort.
+    def __init__(self, items: Iterable[Tuple[str, datetime]] = ()):
+        self.times: Dict[str, datetime] = dict(items)
+        self.entries: List[Tuple[datetime, str]] = sorted(
+            (time, key) for key, time in self.times.items()
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, key: str, time: datetime) -> None:
+        if self.times.get(key) == time:
+            return
+        self.remove(key)
+        self.times[key] = time
+        insort(self.entries, (time, key))
+
+    def remove(self, key: str) -> None:
+        time = self.times.pop(key, None)
+        if time is None:
+            return
+        i = bisect_left(self.entries, (time, key))
+        del self.entries[i]
+
+    def _bounds(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        # Keys with start <= time < end.
+        lo = bisect_left(self.entries, (start, ""))
+        hi = bisect_left(self.entries, (end, ""), lo)
+        return lo, hi
+
+    def count(self, start: datetime, end: datetime) -> int:
+        lo, hi = self._bounds(start, end)
+        return hi - lo
+
+    def between(
+        self,
+        start: datetime,
+        end: datetime,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> Iterator[str]:
+        # after is the (time, key) position of the last key already seen; it
+        # is a position, so it stays valid if that key has changed since.
+        lo, hi = self._bounds(start, end)
+        if after is not None:
+            lo = max(lo, bisect_right(self.entries, after))
+        for i in range(lo, hi):
+            yield self.entries[i][1]
+
+    def latest(self, n: int) -> List[str]:
+        return [
+            key for _, key in reversed(self.entries[max(len(self.entries) - n, 0) :])
+        ]
+
+
+class BirthdayIndex:
+    # Entries are (month, day, name) tuples kept in calendar order, which is
+    # the day-of-year order of a leap year, so 29 February has its own slot.
+    # Initial birthdays are sorted once rather than inserted one by one.
+    def __init__(self, birthdays: Iterable[Tuple[str, date]] = ()):
+        self.days: Dict[str, Tuple[int, int]] = {
+            name: (birthday.month, birthday.day) for name, birthday in birthdays
+        }
+        self.entries: List[Tuple[int, int, str]] = sorted(
+            (*key, name) for name, key in self.days.items()
+        )
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def add(self, name: str, birthday: date) -> None:
+        self.remove(name)
+        key = (birthday.month, birthday.day)
+        self.days[name] = key
+        insort(self.entries, (*key, name))
+
+    def remove(self, name: str) -> None:
+        key = self.days.pop(name, None)
+        if key is None:
+            return
+        i = bisect_left(self.entries, (*key, name))
+        del self.entries[i]
+
+    @staticmethod
+    def occurrence(year: int, month: int, day: int) -> date:
+        # 29 February birthdays are celebrated on 1 March in common years.
+        if (month, day) == (2, 29) and not isleap(year):
+            return date(year, 3, 1)
+        return date(year, month, day)
+
+    def between(self, start: date, end: date) -> List[Tuple[date, str]]:
+        # Within a year-long window each birthday occurs once, apart from
+        # 29 February shifting between 1 March and 29 February.
+        year_later = self.occurrence(start.year + 1, start.month, start.day)
+        end = min(end, year_later - timedelta(days=1))
+        result = []
+        seen = set()
+        segment_start = start
+        while segment_start <= end:
+            year = segment_start.year
+            segment_end = min(end, date(year, 12, 31))
+            low = (segment_start.month, segment_start.day)
+            if low == (3, 1) and not isleap(year):
+                low = (2, 29)
+            lo = bisect_left(self.entries, low)
+            hi = bisect_left(self.entries, (segment_end.month, segment_end.day + 1))
+            for month, day, name in self.entries[lo:hi]:
+                if name not in seen:
+                    seen.add(name)
+                    result.append((self.occurrence(year, month, day), name))
+            segment_start = date(year + 1, 1, 1)
+        return result
+
+    def in_month(self, month: int) -> List[Tuple[int, int, str]]:
+        lo = bisect_left(self.entries, (month,))
+        hi = bisect_left(self.entries, (month + 1,))
+        return self.entries[lo:hi]
@@ -0,0 +1,130 @@
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+from .metrics import STORAGE_READ, STORAGE_WRITTEN
+
+
+def journal_path(filename: str) -> str:
+    return f"{filename}.journal"
+
+
+class Journal:
+    # Every entry carries the full new state of one item ("put") or its
+    # removal ("delete"), so replaying an entry twice is harmless. Entries
+    # are written through as whole lines, so other processes sharing the
+    # file can read them as soon as append() returns.
+
+    def __init__(self, filename: str, fsync: bool = False):
+        self.filename = filename
+        self.fsync = fsync
+        self.entries = 0
+        # The file read so far: its inode and the end of the last whole line.
+        self.inode: Optional[int] = None
+        self.position = 0
+        self._file = None
+
+    def stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def append(self, op: str, key: str, value: Optional[Dict[str, Any]] = None) -> None:
+        entry = {"op": op, "key": key}
+        if value is not None:
+            entry["value"] = value
+        if self._file is None:
+            self._file = open(self.filename, "ab")
+            self.inode = os.fstat(self._file.fileno()).st_ino
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self.entries += 1
+        self.position += len(data)
+        STORAGE_WRITTEN.inc(len(data), target="journal")
+
+    def flush(self) -> None:
+        if self._file is not None and self.fsync:
+            os.fsync(self._file.fileno())
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        self.close()
+        self.entries = 0
+        self.position = 0
+        stat = self.stat()
+        self.inode = stat[0] if stat else None
+        return self.read()
+
+    def read(self) -> Iterator[Dict[str, Any]]:
+        # Yields the whole lines after the current position. A line still
+        # being written by another process is left for the next read.
+        try:
+            with open(self.filename, "rb") as f:
+                if self.inode is None:
+                    self.inode = os.fstat(f.fileno()).st_ino
+                f.seek(self.position)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        STORAGE_READ.inc(end, target="journal")
+        self.position += end
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn write from a crash is cut off by the next append.
+                continue
+            self.entries += 1
+            yield entry
+
+    def drop_torn_tail(self) -> None:
+        # Called with the store locked, when no other process is writing:
+        # bytes after the last whole line are left over from a crash.
+        stat = self.stat()
+        if stat is not None and stat[1] > self.position:
+            self.close()
+            os.truncate(self.filename, self.position)
+
+    def discard_before(self, offset: int, entries: int) -> None:
+        # Drops the entries up to an offset once a snapshot holds them. The
+        # rest is rewritten to a new file and renamed, so a crash leaves
+        # either the whole journal or just the tail, and replaying either is
+        # correct.
+        self.close()
+        try:
+            with open(self.filename, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b""
+        if tail:
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, "wb") as f:
+                f.write(tail)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_filename, self.filename)
+            self.inode = os.stat(self.filename).st_ino
+        elif os.path.exists(self.filename):
+            os.remove(self.filename)
+            self.inode = None
+        self.position = max(self.position - offset, 0)
+        self.entries = max(self.entries - entries, 0)
+
+    def reset(self) -> None:
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.entries = 0
+        self.inode = None
+        self.position = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
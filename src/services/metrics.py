@@ -0,0 +1,219 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(_labels(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in sorted(items):
+            yield self.name, labels, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # Per label set: bucket counts (the last one is +Inf), sum and max.
+        self.series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            counts, totals = series
+            counts[bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] = max(totals[1], value)
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, labels: Labels) -> int:
+        return sum(self.series[labels][0])
+
+    def quantile(self, q: float, labels: Labels) -> float:
+        # Interpolates within the bucket holding the q-th observation, so the
+        # result is an estimate that is exact only at bucket boundaries.
+        counts, totals = self.series[labels]
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else totals[1]
+                return min(lower + (upper - lower) * (rank - seen) / count, totals[1])
+            seen += count
+        return totals[1]
+
+    def summary(self) -> Iterator[Tuple[Labels, int, float, float, float, float]]:
+        with self.lock:
+            keys = sorted(self.series)
+        for labels in keys:
+            _, (total, peak) = self.series[labels]
+            yield (
+                labels,
+                self.count(labels),
+                total,
+                self.quantile(0.5, labels),
+                self.quantile(0.95, labels),
+                peak,
+            )
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self.lock:
+            items = [
+                (labels, list(c), list(t)) for labels, (c, t) in self.series.items()
+            ]
+        for labels, counts, (total, _) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", labels + (("le", le),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        # Values are read when the metrics are collected; None means there is
+        # no value to report.
+        self.callbacks: Dict[Labels, Callable[[], Optional[float]]] = {}
+
+    def set_function(self, func: Callable[[], Optional[float]], **labels: str) -> None:
+        self.callbacks[_labels(labels)] = func
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for labels, func in sorted(self.callbacks.items(), key=lambda item: item[0]):
+            value = func()
+            if value is not None:
+                yield self.name, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(name, help))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str) -> None:
+        # Written next to the target and renamed, so a scraper reading the
+        # file never sees half of it.
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_filename, filename)
+
+
+METRICS = Registry()
+
+COMMAND_SECONDS = METRICS.histogram(
+    "memok_command_seconds", "Time to run a command, output included"
+)
+COMMAND_ERRORS = METRICS.counter(
+    "memok_command_errors_total", "Commands that failed, by error type"
+)
+STARTUP_SECONDS = METRICS.histogram(
+    "memok_startup_seconds", "Time from start to the first prompt or command"
+)
+STORAGE_SECONDS = METRICS.histogram(
+    "memok_storage_seconds", "Time spent loading, saving and committing data"
+)
+STORAGE_WRITTEN = METRICS.counter(
+    "memok_storage_written_bytes_total", "Bytes written to data files"
+)
+STORAGE_READ = METRICS.counter(
+    "memok_storage_read_bytes_total", "Bytes of data files read or mapped"
+)
+CACHE_REQUESTS = METRICS.counter(
+    "memok_cache_requests_total", "Result and rendering cache lookups by result"
+)
+OBJECTS = METRICS.gauge("memok_objects", "Number of stored objects by kind")
+
+
+def file_size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
@@ -1,11 +1,239 @@
-from typing import Dict, List, Optional
-import pickle
-from ..models.base import Note
+from bisect import bisect_right
+from datetime import datetime
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
+from ..models.base import ConflictError, Note
+from .backends import SnapshotBackend, StorageBackend
+from .blobs import BlobStore
+from .cache import LRUCache, RENDERED_SIZE, RESULTS_SIZE, cached_listing
+from .index import PostingIndex, RankIndex, SuggestionIndex, TimeIndex, TrigramIndex
+from .paging import Source, iter_sorted
+from .query import QueryPlan, parse_query
+
+# One clause of a tag query: required, alternative and excluded tags. A
+# query matches the notes that match any of its clauses.
+TagClause = Tuple[List[str], List[str], List[str]]
+
+# Timestamps kept in time order, by the name used in queries and commands.
+TIME_FIELDS = ("created", "modified")
 
 
 class NoteBook:
     def __init__(self):
-        self.notes: Dict[str, Note] = {}
+        self.notes: MutableMapping[str, Note] = {}
+        self.backend: Optional[StorageBackend] = None
+        self._text_index: Optional[TrigramIndex] = None
+        self._tag_index: Optional[PostingIndex] = None
+        self._title_index: Optional[SuggestionIndex] = None
+        self._time_index: Optional[Dict[str, TimeIndex]] = None
+        self._rank_index: Optional[RankIndex] = None
+        # Set once a suggestion has compared the stored titles instead of an
+        # index.
+        self._suggested = False
+        # Bumped by every change, so cached results from before it are stale.
+        self.generation = 0
+        # Weighed by the number of keys listed, and by the rendered items.
+        self.results = LRUCache("notes", RESULTS_SIZE)
+        self.rendered = LRUCache("notes_rendered", RENDERED_SIZE)
+        # Large note bodies are kept here instead of in memory when set.
+        self.blobs: Optional[BlobStore] = None
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def _note_changed(self, note: Note) -> None:
+        self.notes[note.title] = note
+        self._store_content(note)
+        if self.backend is not None:
+            self._write(self.backend.put, note.title, note.to_dict())
+        self._reindex(note)
+        if self.on_change is not None:
+            self.on_change()
+
+    def _note_deleted(self, title: str) -> None:
+        if self.backend is not None:
+            self._write(self.backend.delete, title)
+        self._unindex(title)
+        if self.on_change is not None:
+            self.on_change()
+
+    def _write(self, write: Callable, *args) -> None:
+        try:
+            write(*args)
+        except ConflictError:
+            # The backend has taken in the other process's version.
+            self.refresh()
+            raise
+
+    def _reindex(self, note: Note) -> None:
+        self.generation += 1
+        if self._text_index is not None:
+            self._text_index.add(note.title, (note.title, note.content))
+        if self._tag_index is not None:
+            self._tag_index.add(note.title, note.tags)
+        if self._title_index is not None:
+            self._title_index.add(note.title)
+        if self._time_index is not None:
+            for field, index in self._time_index.items():
+                index.add(note.title, getattr(note, f"{field}_at"))
+        if self._rank_index is not None:
+            self._rank_index.add(note.title, note.title, note.content)
+
+    def _unindex(self, title: str) -> None:
+        self.generation += 1
+        if self._text_index is not None:
+            self._text_index.remove(title)
+        if self._tag_index is not None:
+            self._tag_index.remove(title)
+        if self._title_index is not None:
+            self._title_index.remove(title)
+        if self._time_index is not None:
+            for index in self._time_index.values():
+                index.remove(title)
+        if self._rank_index is not None:
+            self._rank_index.remove(title)
+
+    def refresh(self) -> None:
+        # Takes in changes made by other memok processes sharing the data.
+        if self.backend is None:
+            return
+        changed = self.backend.refresh()
+        if changed is None:
+            self.notes = self.backend.mapping
+            self._reset_indexes()
+            return
+        for title in changed:
+            note = self.notes.get(title)
+            if note is None:
+                self._unindex(title)
+            else:
+                self._reindex(note)
+
+    def _reset_indexes(self) -> None:
+        self.generation += 1
+        self._text_index = None
+        self._tag_index = None
+        self._title_index = None
+        self._time_index = None
+        self._rank_index = None
+        self._suggested = False
+
+    def _store_content(self, note: Note) -> None:
+        if self.blobs is None or note.blob is not None:
+            return
+        content = note.content
+        if self.blobs.should_store(content):
+            note.store_content(self.blobs.put(content))
+
+    def _adopt(self, note: Note) -> None:
+        if note.blob is not None:
+            note.blob.store = self.blobs
+
+    def compact_blobs(self) -> Tuple[int, int]:
+        # Moves large bodies written before the blob store was enabled into
+        # it, then deletes blobs that no note refers to any more.
+        if self.blobs is None:
+            return 0, 0
+        moved = 0
+        live = set()
+        for note in list(self.notes.values()):
+            if note.blob is None and self.blobs.should_store(note.content):
+                self._note_changed(note)
+                moved += 1
+            if note.blob is not None:
+                live.add(note.blob.digest)
+        return moved, self.blobs.collect(live)
+
+    @property
+    def text_index(self) -> TrigramIndex:
+        if self._text_index is None:
+            index = TrigramIndex()
+            for note in self.notes.values():
+                index.add(note.title, (note.title, note.content))
+            self._text_index = index
+        return self._text_index
+
+    @property
+    def tag_index(self) -> PostingIndex:
+        if self._tag_index is None:
+            index = PostingIndex()
+            for note in self.notes.values():
+                index.add(note.title, note.tags)
+            self._tag_index = index
+        return self._tag_index
+
+    @property
+    def title_index(self) -> SuggestionIndex:
+        if self._title_index is None:
+            self._title_index = SuggestionIndex(self.notes)
+        return self._title_index
+
+    @property
+    def time_index(self) -> Dict[str, TimeIndex]:
+        if self._time_index is None:
+            notes = list(self.notes.values())
+            self._time_index = {
+                field: TimeIndex(
+                    (note.title, getattr(note, f"{field}_at")) for note in notes
+                )
+                for field in TIME_FIELDS
+            }
+        return self._time_index
+
+    @property
+    def rank_index(self) -> RankIndex:
+        if self._rank_index is None:
+            index = RankIndex()
+            for note in self.notes.values():
+                index.add(note.title, note.title, note.content)
+            self._rank_index = index
+        return self._rank_index
+
+    def _listing(self, key: Tuple, source: Source) -> Source:
+        return cached_listing(
+            self.results, key, lambda: self.generation, source, lambda note: note.title
+        )
+
+    def search_listing(self, query: str) -> Source:
+        return self._listing(
+            ("text", query.lower()),
+            lambda after: self.iter_search_by_text(query, after),
+        )
+
+    def tags_listing(self, clauses: List[TagClause]) -> Source:
+        key = tuple(
+            tuple(tuple(sorted(tag.lower() for tag in tags)) for tags in clause)
+            for clause in clauses
+        )
+        return self._listing(
+            ("tags",) + key,
+            lambda after: self.iter_tag_clauses(clauses, after),
+        )
+
+    def query_listing(self, query: str) -> Source:
+        return self._listing(
+            ("query", query),
+            lambda after: self.plan_query(query).iter_notes(after),
+        )
+
+    def render(self, title: str) -> str:
+        return self.rendered.lookup(
+            title, self.generation, lambda: str(self.notes[title])
+        )
+
+    def suggest(self, title: str, n: int = 1) -> List[str]:
+        if self._title_index is None and not self._suggested:
+            # A first mistyped title is compared with the stored titles; the
+            # index is built by the next one.
+            self._suggested = True
+            return SuggestionIndex.scan(self.notes, title, n)
+        return self.title_index.suggest(title, n)
 
     def add_note(
         self, title: str, content: str, tags: Optional[List[str]] = None
@@ -13,6 +241,7 @@ class NoteBook:
         if title in self.notes:
             raise KeyError(f"Note with title '{title}' already exists")
         self.notes[title] = Note(title, content, set(tags) if tags else set())
+        self._note_changed(self.notes[title])
 
     def find_note(self, title: str) -> Optional[Note]:
         return self.notes.get(title)
@@ -21,46 +250,150 @@ class NoteBook:
         if title not in self.notes:
             raise KeyError(f"Note '{title}' not found")
         self.notes[title].update_content(content)
+        self._note_changed(self.notes[title])
 
     def delete_note(self, title: str) -> None:
         if title not in self.notes:
             raise KeyError(f"Note '{title}' not found")
         del self.notes[title]
+        self._note_deleted(title)
 
     def get_all_notes(self) -> List[Note]:
-        return list(self.notes.values())
+        return list(self.iter_notes())
+
+    def iter_notes(self, after: Optional[str] = None) -> Iterator[Note]:
+        for _, note in iter_sorted(self.notes, after):
+            yield note
 
     def add_tag(self, title: str, tag: str) -> None:
         if title not in self.notes:
             raise KeyError(f"Note '{title}' not found")
         self.notes[title].add_tag(tag)
+        self._note_changed(self.notes[title])
 
     def remove_tag(self, title: str, tag: str) -> None:
         if title not in self.notes:
             raise KeyError(f"Note '{title}' not found")
         self.notes[title].remove_tag(tag)
+        self._note_changed(self.notes[title])
 
     def search_by_tags(self, tags: List[str]) -> List[Note]:
-        search_tags = set(tag.lower() for tag in tags)
-        return [
-            note for note in self.notes.values() if search_tags.intersection(note.tags)
-        ]
+        return self.query_tags(any_of=tags)
+
+    def query_tags(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+    ) -> List[Note]:
+        return list(self.iter_query_tags(all_of, any_of, none_of))
+
+    def iter_query_tags(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+        after: Optional[str] = None,
+    ) -> Iterator[Note]:
+        return self.iter_tag_clauses(
+            [(list(all_of), list(any_of), list(none_of))], after
+        )
+
+    def iter_tag_clauses(
+        self, clauses: List[TagClause], after: Optional[str] = None
+    ) -> Iterator[Note]:
+        titles = self.tag_index.query_any(
+            tuple([tag.lower() for tag in tags] for tags in clause)
+            for clause in clauses
+        )
+        start = 0 if after is None else bisect_right(titles, after)
+        for title in titles[start:]:
+            yield self.notes[title]
+
+    def tag_counts(self) -> List[Tuple[str, int]]:
+        return self.tag_index.counts()
+
+    def recent_notes(self, n: int, field: str = "modified") -> List[Note]:
+        return [self.notes[title] for title in self.time_index[field].latest(n)]
+
+    def iter_notes_between(
+        self,
+        start: datetime,
+        end: datetime,
+        field: str = "modified",
+        after: Optional[str] = None,
+        after_time: Optional[datetime] = None,
+    ) -> Iterator[Note]:
+        # Oldest first, from start up to but not including end. Listings
+        # continue after a title shown at after_time, or after the title's
+        # current time when that is not given.
+        index = self.time_index[field]
+        position = None
+        if after is not None:
+            if after_time is None:
+                after_time = index.times.get(after)
+            if after_time is None:
+                raise KeyError(f"Note '{after}' not found")
+            position = (after_time, after)
+        for title in index.between(start, end, position):
+            yield self.notes[title]
+
+    def rank_by_text(self, query: str, k: int) -> List[Tuple[Note, float]]:
+        # The k notes most relevant to the query words, best first.
+        ranked = self.results.lookup(
+            ("rank", query.lower(), k),
+            self.generation,
+            lambda: self.rank_index.top(query, k),
+        )
+        return [(self.notes[title], score) for title, score in ranked]
 
     def search_by_text(self, query: str) -> List[Note]:
+        return list(self.iter_search_by_text(query))
+
+    def iter_search_by_text(
+        self, query: str, after: Optional[str] = None
+    ) -> Iterator[Note]:
         query = query.lower()
-        return [
-            note
-            for note in self.notes.values()
-            if query in note.title.lower() or query in note.content.lower()
-        ]
+        if not query:
+            yield from self.iter_notes(after)
+            return
+        for title in sorted(self.text_index.candidates(query)):
+            if after is not None and title <= after:
+                continue
+            note = self.notes[title]
+            if query in note.title.lower() or query in note.content.lower():
+                yield note
+
+    def plan_query(self, query: str) -> QueryPlan:
+        return QueryPlan(self, parse_query(query))
+
+    def query(self, query: str) -> List[Note]:
+        return list(self.plan_query(query).iter_notes())
+
+    def open(self, backend: StorageBackend) -> None:
+        if self.backend is not None:
+            self.backend.close()
+        self.backend = backend
+        self.notes = backend.load(self._adopt)
+        self._reset_indexes()
+
+    def commit(self, lock=None) -> None:
+        if self.backend is None:
+            return
+        if lock is None:
+            self.backend.commit(self.notes)
+        else:
+            self.backend.background_commit(self.notes, lock)
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
 
     def save_to_file(self, filename: str = "notebook.pkl") -> None:
-        with open(filename, "wb") as f:
-            pickle.dump(self.notes, f)
+        backend = self.backend
+        if not isinstance(backend, SnapshotBackend) or backend.filename != filename:
+            backend = SnapshotBackend(filename, Note.from_dict, Note.FIELDS)
+        backend.save(self.notes)
 
     def load_from_file(self, filename: str = "notebook.pkl") -> None:
-        try:
-            with open(filename, "rb") as f:
-                self.notes = pickle.load(f)
-        except FileNotFoundError:
-            self.notes = {}
+        self.open(SnapshotBackend(filename, Note.from_dict, Note.FIELDS))
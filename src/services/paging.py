@@ -0,0 +1,88 @@
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+Source = Callable[[Optional[str]], Iterator[Any]]
+
+
+def iter_sorted(
+    data: Mapping[str, Any], after: Optional[str] = None
+) -> Iterator[Tuple[str, Any]]:
+    # Snapshot and SQLite mappings stream their items in key order, plain
+    # dicts have to be sorted first.
+    iter_items = getattr(data, "iter_items", None)
+    if iter_items is not None:
+        return iter_items(after)
+    keys = sorted(key for key in data if after is None or key > after)
+    return ((key, data[key]) for key in keys)
+
+
+def iter_stored(
+    data: Mapping[str, Any], after: Optional[str] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Items in key order in their stored form. Snapshot and SQLite mappings
+    # read it without building the items.
+    iter_dicts = getattr(data, "iter_dicts", None)
+    if iter_dicts is not None:
+        return iter_dicts(after)
+    return ((key, item.to_dict()) for key, item in iter_sorted(data, after))
+
+
+class Page:
+    # Renders one page of a listing lazily. The source yields items in key
+    # order starting after a key, so the next page continues from the last
+    # key shown instead of counting from the start again.
+    def __init__(
+        self,
+        source: Source,
+        key: Callable[[Any], str],
+        render: Callable[[Any], str] = str,
+        separator: str = "\n",
+        empty: str = "No results.",
+        offset: int = 0,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+    ):
+        self.source = source
+        self.key = key
+        self.render = render
+        self.separator = separator
+        self.empty = empty
+        self.offset = offset
+        self.limit = limit
+        self.after = after
+        self.last_key: Optional[str] = None
+        self.has_more = False
+
+    def __iter__(self) -> Iterator[str]:
+        # Chunks are meant to be printed one per line, so only the extra
+        # newlines of the separator are added to them.
+        items = islice(self.source(self.after), self.offset, None)
+        prefix = self.separator[:-1]
+        count = 0
+        for item in items:
+            if self.limit is not None and count == self.limit:
+                self.has_more = True
+                yield f"{prefix}-- more results, type 'next' to continue --"
+                return
+            self.last_key = self.key(item)
+            yield (prefix if count else "") + self.render(item)
+            count += 1
+        if not count:
+            first = self.after is None and not self.offset
+            yield self.empty if first else "No more results."
+
+    def __str__(self) -> str:
+        return "\n".join(self)
+
+    def next_page(self) -> Optional["Page"]:
+        if not self.has_more:
+            return None
+        return Page(
+            self.source,
+            self.key,
+            self.render,
+            self.separator,
+            self.empty,
+            limit=self.limit,
+            after=self.last_key,
+        )
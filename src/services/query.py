@@ -0,0 +1,369 @@
+from abc import ABC, abstractmethod
+import re
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Set, Tuple
+from ..models.base import Note, ValidationError
+
+# Fields a query term can name, with the operators each one accepts. A bare
+# word or quoted phrase searches the text, like search-notes.
+TEXT_OPERATORS = (":",)
+TIME_OPERATORS = (":", "=", ">", ">=", "<", "<=")
+FIELDS = {
+    "tag": TEXT_OPERATORS,
+    "text": TEXT_OPERATORS,
+    "title": TEXT_OPERATORS,
+    "created": TIME_OPERATORS,
+    "modified": TIME_OPERATORS,
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<paren>[()])
+        | (?P<neg>-(?=[^\s()]))?
+        (?:(?P<term>(?P<field>[A-Za-z]+)(?P<op>>=|<=|[:=<>])
+                   (?P<value>"[^"]*"|[^\s()"]+))
+        | (?P<phrase>"[^"]*")
+        | (?P<word>[^\s()"]+))
+    )""",
+    re.VERBOSE,
+)
+
+
+class Predicate(ABC):
+    # A node of a parsed query. estimate() is an upper bound of the number of
+    # matching notes, candidates() returns a superset of their titles from an
+    # index, or None when the node can only be checked note by note. cost
+    # ranks how expensive matches() is, so cheap checks run first.
+    cost = 0
+    # Whether candidates() can list titles, and whether every one of them
+    # matches, so the node needs no check of its own.
+    indexed = False
+    exact = False
+
+    def estimate(self, book) -> int:
+        return len(book.notes)
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        return None
+
+    @abstractmethod
+    def matches(self, note: Note) -> bool:
+        pass
+
+
+class Tag(Predicate):
+    indexed = True
+    exact = True
+
+    def __init__(self, tag: str):
+        self.tag = tag.lower()
+
+    def estimate(self, book) -> int:
+        return len(book.tag_index.get(self.tag))
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        return set(book.tag_index.get(self.tag))
+
+    def matches(self, note: Note) -> bool:
+        return self.tag in note.tags
+
+    def __str__(self) -> str:
+        return f"tag:{self.tag}"
+
+
+class Text(Predicate):
+    # The trigram index covers titles and bodies, so its candidates still
+    # have to be checked. Reading a body may mean loading a blob.
+    indexed = True
+    cost = 3
+
+    def __init__(self, text: str, title_only: bool = False):
+        self.text = text.lower()
+        self.title_only = title_only
+        if title_only:
+            self.cost = 2
+
+    def estimate(self, book) -> int:
+        return book.text_index.estimate(self.text)
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        return book.text_index.candidates(self.text)
+
+    def matches(self, note: Note) -> bool:
+        if self.text in note.title.lower():
+            return True
+        return not self.title_only and self.text in note.content.lower()
+
+    def __str__(self) -> str:
+        field = "title" if self.title_only else "text"
+        return f'{field}:"{self.text}"'
+
+
+class Time(Predicate):
+    # Matches notes whose timestamp lies in [start, end), which the time
+    # index counts and lists exactly.
+    indexed = True
+    exact = True
+    cost = 1
+
+    def __init__(self, field: str, start: datetime, end: datetime, label: str):
+        self.field = field
+        self.start = start
+        self.end = end
+        self.label = label
+
+    def estimate(self, book) -> int:
+        return book.time_index[self.field].count(self.start, self.end)
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        return set(book.time_index[self.field].between(self.start, self.end))
+
+    def matches(self, note: Note) -> bool:
+        return self.start <= getattr(note, f"{self.field}_at") < self.end
+
+    def __str__(self) -> str:
+        return self.label
+
+
+class And(Predicate):
+    def __init__(self, children: List[Predicate]):
+        self.children = children
+        self.cost = max(child.cost for child in children)
+        self.indexed = any(child.indexed for child in children)
+
+    def estimate(self, book) -> int:
+        return min(child.estimate(book) for child in self.children)
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        driver, _ = plan_and(self.children, book)
+        return None if driver is None else driver.candidates(book)
+
+    def matches(self, note: Note) -> bool:
+        return all(child.matches(note) for child in self.children)
+
+    def __str__(self) -> str:
+        return "(" + " AND ".join(str(child) for child in self.children) + ")"
+
+
+class Or(Predicate):
+    def __init__(self, children: List[Predicate]):
+        self.children = children
+        self.cost = max(child.cost for child in children)
+        self.indexed = all(child.indexed for child in children)
+        self.exact = all(child.exact for child in children)
+
+    def estimate(self, book) -> int:
+        total = sum(child.estimate(book) for child in self.children)
+        return min(total, len(book.notes))
+
+    def candidates(self, book) -> Optional[Set[str]]:
+        result: Set[str] = set()
+        for child in self.children:
+            titles = child.candidates(book)
+            if titles is None:
+                return None
+            result |= titles
+        return result
+
+    def matches(self, note: Note) -> bool:
+        return any(child.matches(note) for child in self.children)
+
+    def __str__(self) -> str:
+        return "(" + " OR ".join(str(child) for child in self.children) + ")"
+
+
+class Not(Predicate):
+    def __init__(self, child: Predicate):
+        self.child = child
+        self.cost = child.cost
+
+    def matches(self, note: Note) -> bool:
+        return not self.child.matches(note)
+
+    def __str__(self) -> str:
+        return f"NOT {self.child}"
+
+
+def plan_and(
+    children: List[Predicate], book
+) -> Tuple[Optional[Predicate], List[Predicate]]:
+    # The term with the fewest estimated matches that an index can list
+    # drives the query; the others are only checked on its candidates,
+    # cheapest and most selective first.
+    estimates = {id(child): child.estimate(book) for child in children}
+    ranked = sorted(children, key=lambda child: estimates[id(child)])
+    driver = next((child for child in ranked if child.indexed), None)
+    checks = [child for child in children if child is not driver or not child.exact]
+    checks.sort(key=lambda child: (child.cost, estimates[id(child)]))
+    return driver, checks
+
+
+class QueryPlan:
+    def __init__(self, book, query: Predicate):
+        self.book = book
+        self.query = query
+        if isinstance(query, And):
+            self.driver, self.checks = plan_and(query.children, book)
+        elif query.indexed:
+            self.driver = query
+            self.checks = [] if query.exact else [query]
+        else:
+            self.driver, self.checks = None, [query]
+        self.estimate = (
+            len(book.notes) if self.driver is None else self.driver.estimate(book)
+        )
+
+    def iter_notes(self, after: Optional[str] = None) -> Iterator[Note]:
+        notes = self.book.notes
+        if self.driver is None:
+            source = self.book.iter_notes(after)
+        else:
+            titles = sorted(
+                title
+                for title in self.driver.candidates(self.book)
+                if after is None or title > after
+            )
+            source = (notes[title] for title in titles)
+        for note in source:
+            if all(check.matches(note) for check in self.checks):
+                yield note
+
+    def describe(self) -> str:
+        if self.driver is None:
+            lines = [f"Scan all {self.estimate} notes"]
+        else:
+            lines = [f"Look up {self.driver} (at most {self.estimate} notes)"]
+        for check in self.checks:
+            lines.append(f"  then check {check}")
+        return "\n".join(lines)
+
+
+def parse_time(value: str) -> datetime:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValidationError(f"Invalid date: {value}. Use YYYY-MM-DD or DD.MM.YYYY")
+
+
+def time_range(field: str, op: str, value: str) -> Time:
+    # A date stands for the whole day, so modified>2026-01-01 starts on the
+    # next day and modified:2026-01-01 matches any time on that day.
+    day = parse_time(value)
+    next_day = day + timedelta(days=1)
+    start, end = {
+        ":": (day, next_day),
+        "=": (day, next_day),
+        ">": (next_day, datetime.max),
+        ">=": (day, datetime.max),
+        "<": (datetime.min, day),
+        "<=": (datetime.min, next_day),
+    }[op]
+    return Time(field, start, end, f"{field}{op}{value}")
+
+
+def make_term(field: str, op: str, value: str) -> Predicate:
+    field = field.lower()
+    if field not in FIELDS:
+        raise ValidationError(
+            f"Unknown field '{field}'. Use one of: {', '.join(FIELDS)}"
+        )
+    if op not in FIELDS[field]:
+        raise ValidationError(f"Field '{field}' does not support '{op}'")
+    if not value:
+        raise ValidationError(f"Missing value for '{field}'")
+    if field == "tag":
+        return Tag(value)
+    if field in ("text", "title"):
+        return Text(value, title_only=field == "title")
+    return time_range(field, op, value)
+
+
+def tokenize(query: str) -> List[Tuple[str, object]]:
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = TOKEN.match(query, position)
+        if match is None:
+            raise ValidationError("Unterminated quote in query")
+        position = match.end()
+        if match["paren"]:
+            tokens.append((match["paren"], None))
+            continue
+        if match["neg"]:
+            tokens.append(("NOT", None))
+        if match["term"]:
+            value = match["value"].strip('"')
+            tokens.append(("term", make_term(match["field"], match["op"], value)))
+        elif match["phrase"]:
+            tokens.append(("term", make_term("text", ":", match["phrase"][1:-1])))
+        elif match["word"].upper() in ("AND", "OR", "NOT") and not match["neg"]:
+            tokens.append((match["word"].upper(), None))
+        else:
+            tokens.append(("term", make_term("text", ":", match["word"])))
+    return tokens
+
+
+class Parser:
+    # query := or; or := and (OR and)*; and := unary ([AND] unary)*;
+    # unary := NOT unary | ( query ) | term. NOT binds tightest, then AND.
+    def __init__(self, tokens: List[Tuple[str, object]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def take(self) -> Tuple[str, object]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self) -> Predicate:
+        if not self.tokens:
+            raise ValidationError("Empty query")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValidationError(f"Unexpected '{self.peek()}' in query")
+        return node
+
+    def parse_or(self) -> Predicate:
+        children = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self) -> Predicate:
+        children = [self.parse_unary()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            children.append(self.parse_unary())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_unary(self) -> Predicate:
+        kind = self.peek()
+        if kind is None:
+            raise ValidationError("Query ends too early")
+        kind, value = self.take()
+        if kind == "NOT":
+            return Not(self.parse_unary())
+        if kind == "(":
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise ValidationError("Missing ')' in query")
+            self.take()
+            return node
+        if kind == "term":
+            return value
+        raise ValidationError(f"Unexpected '{kind}' in query")
+
+
+def parse_query(query: str) -> Predicate:
+    return Parser(tokenize(query)).parse()
@@ -1,4 +1,5 @@
-from typing import Optional
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
 from ..models.contact import (
     Name,
     Phone,
@@ -11,45 +12,112 @@ from ..models.contact import (
 
 
 class Record:
+    FIELDS = (
+        ("name", False),
+        ("phones", True),
+        ("birthday", False),
+        ("email", False),
+        ("address", False),
+    )
+    __slots__ = ("name", "phones", "birthday", "email", "address", "_book")
+
     def __init__(self, name: str):
         self.name = Name(name)
         self.phones = PhoneList()
         self.birthday: Optional[Birthday] = None
         self.email: Optional[Email] = None
         self.address: Optional[Address] = None
+        self._book = None
+
+    @contextmanager
+    def _editing(self):
+        # The book sees every change, and may bring the record up to date
+        # before it is made; nothing is stored when the change fails.
+        if self._book is None:
+            yield
+        else:
+            with self._book.editing(self):
+                yield
 
     def add_phone(self, phone: str) -> None:
-        if self.find_phone(phone):
-            raise ValidationError(f"Phone number {phone} already exists")
-        self.phones.append(Phone(phone))
+        with self._editing():
+            if self.find_phone(phone):
+                raise ValidationError(f"Phone number {phone} already exists")
+            self.phones.append(Phone(phone))
 
     def remove_phone(self, phone: str) -> None:
-        normalized = Phone.normalize_phone(phone)
-        original_length = len(self.phones)
-        self.phones = PhoneList([p for p in self.phones if p.value != normalized])
-        if len(self.phones) == original_length:
-            raise ValidationError(f"Phone number {phone} not found")
+        with self._editing():
+            index = self.phones.find(Phone.normalize_phone(phone))
+            if index < 0:
+                raise ValidationError(f"Phone number {phone} not found")
+            del self.phones[index]
 
     def edit_phone(self, old_phone: str, new_phone: str) -> None:
-        old_normalized = Phone.normalize_phone(old_phone)
-        for p in self.phones:
-            if p.value == old_normalized:
-                p.value = new_phone
-                return
-        raise ValidationError(f"Phone number {old_phone} not found")
+        with self._editing():
+            index = self.phones.find(Phone.normalize_phone(old_phone))
+            if index < 0:
+                raise ValidationError(f"Phone number {old_phone} not found")
+            self.phones[index] = Phone(new_phone)
 
     def find_phone(self, phone: str) -> Optional[Phone]:
-        normalized = Phone.normalize_phone(phone)
-        return next((p for p in self.phones if p.value == normalized), None)
+        index = self.phones.find(Phone.normalize_phone(phone))
+        return self.phones[index] if index >= 0 else None
 
     def add_birthday(self, birthday: str) -> None:
-        self.birthday = Birthday(birthday)
+        with self._editing():
+            self.birthday = Birthday(birthday)
 
     def add_email(self, email: str) -> None:
-        self.email = Email(email)
+        with self._editing():
+            self.email = Email(email)
 
     def add_address(self, address: str) -> None:
-        self.address = Address(address)
+        with self._editing():
+            self.address = Address(address)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name.value,
+            "phones": [p.value for p in self.phones],
+            "birthday": str(self.birthday) if self.birthday else None,
+            "email": self.email.value if self.email else None,
+            "address": self.address.value if self.address else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Record":
+        record = cls(data["name"])
+        record.phones = PhoneList(Phone(p) for p in data.get("phones") or [])
+        if data.get("birthday"):
+            record.birthday = Birthday(data["birthday"])
+        if data.get("email"):
+            record.email = Email(data["email"])
+        if data.get("address"):
+            record.address = Address(data["address"])
+        return record
+
+    def copy(self) -> "Record":
+        record = Record.__new__(Record)
+        record.name = self.name
+        record._book = None
+        record.update_from(self)
+        return record
+
+    def update_from(self, other: "Record") -> None:
+        # Takes over the fields of another version of the same contact. Field
+        # values are replaced rather than changed, so they are shared.
+        self.phones = PhoneList(other.phones)
+        self.birthday = other.birthday
+        self.email = other.email
+        self.address = other.address
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__[:-1]}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._book = None
 
     def __str__(self) -> str:
         parts = [f"Contact name: {self.name.value}"]
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+import threading
+
+
+class ReadWriteLock:
+    # Writer-preferring, like the server's asyncio lock: once a writer waits,
+    # new readers queue behind it. Threads write in tight loops, though, so a
+    # finishing writer first lets in the readers already waiting, and writers
+    # cannot starve them. The writing thread may take either lock again, and
+    # a reading thread may read again even while a writer waits; a reader
+    # cannot become a writer.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        self._readers_turn = False
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        nested = self._writer == me or getattr(self._local, "reads", 0)
+        if not nested:
+            with self._condition:
+                self._waiting_readers += 1
+                self._condition.wait_for(
+                    lambda: self._writer is None
+                    and (self._readers_turn or not self._waiting_writers)
+                )
+                self._waiting_readers -= 1
+                if not self._waiting_readers:
+                    self._readers_turn = False
+                self._readers += 1
+        self._local.reads = getattr(self._local, "reads", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.reads -= 1
+            if not nested:
+                with self._condition:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me:
+                if getattr(self._local, "reads", 0):
+                    raise RuntimeError("A reader cannot take the write lock")
+                self._waiting_writers += 1
+                try:
+                    self._condition.wait_for(
+                        lambda: self._writer is None
+                        and not self._readers
+                        and not self._readers_turn
+                    )
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+            self._writes += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writes -= 1
+                if not self._writes:
+                    self._writer = None
+                    self._readers_turn = self._waiting_readers > 0
+                    self._condition.notify_all()
@@ -0,0 +1,412 @@
+from collections.abc import ItemsView, MutableMapping, ValuesView
+import mmap
+import os
+import struct
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+MAGIC = b"MEMOKSNP"
+VERSION = 2
+NONE = 0xFFFFFFFF
+
+# magic, version, field count, entry count, string count, the offsets of the
+# schema, entry index, string index, entry data and string data, and the
+# generation. Version 1 files have no generation and count as generation 0.
+HEADER = struct.Struct("<8sIIII5QQ")
+HEADER_V1 = struct.Struct("<8sIIII5Q")
+SCHEMA_FIELD = struct.Struct("<II")
+OFFSET = struct.Struct("<Q")
+U32 = struct.Struct("<I")
+
+Schema = Tuple[Tuple[str, bool], ...]
+
+
+def is_snapshot(filename: str) -> bool:
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def read_generation(filename: str) -> int:
+    # Cheaper than opening the snapshot: only the header is read.
+    try:
+        with open(filename, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if len(header) < HEADER.size or header[: len(MAGIC)] != MAGIC:
+        return 0
+    version = U32.unpack_from(header, len(MAGIC))[0]
+    return HEADER.unpack(header)[-1] if version == VERSION else 0
+
+
+def write_snapshot(
+    filename: str,
+    schema: Schema,
+    items: Iterable[Tuple[str, Dict[str, Any]]],
+    generation: int = 0,
+) -> None:
+    strings: Dict[str, int] = {}
+
+    def string_id(value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        sid = strings.get(value)
+        if sid is None:
+            sid = strings[value] = len(strings)
+        return sid
+
+    schema_ids = [(string_id(name), int(is_list)) for name, is_list in schema]
+    entries: List[List[int]] = []
+    for _, value in sorted(items, key=lambda item: item[0]):
+        entry = []
+        for name, is_list in schema:
+            if is_list:
+                values = value.get(name) or []
+                entry.append(len(values))
+                entry.extend(string_id(v) for v in values)
+            else:
+                entry.append(string_id(value.get(name)))
+        entries.append(entry)
+
+    encoded = [s.encode("utf-8") for s in strings]
+    schema_offset = HEADER.size
+    entry_index_offset = schema_offset + SCHEMA_FIELD.size * len(schema)
+    string_index_offset = entry_index_offset + OFFSET.size * len(entries)
+    entry_data_offset = string_index_offset + OFFSET.size * (len(encoded) + 1)
+    string_data_offset = entry_data_offset + U32.size * sum(map(len, entries))
+
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                len(schema),
+                len(entries),
+                len(encoded),
+                schema_offset,
+                entry_index_offset,
+                string_index_offset,
+                entry_data_offset,
+                string_data_offset,
+                generation,
+            )
+        )
+        for sid, is_list in schema_ids:
+            f.write(SCHEMA_FIELD.pack(sid, is_list))
+        position = entry_data_offset
+        for entry in entries:
+            f.write(OFFSET.pack(position))
+            position += U32.size * len(entry)
+        position = string_data_offset
+        for data in encoded:
+            f.write(OFFSET.pack(position))
+            position += len(data)
+        f.write(OFFSET.pack(position))
+        for entry in entries:
+            f.write(struct.pack(f"<{len(entry)}I", *entry))
+        for data in encoded:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class Snapshot:
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from("<8sI", self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a memok snapshot")
+        if version == 1:
+            header = HEADER_V1.unpack_from(self._mmap, 0) + (0,)
+        elif version == VERSION:
+            header = HEADER.unpack_from(self._mmap, 0)
+        else:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        (
+            _,
+            _,
+            field_count,
+            self.count,
+            self.string_count,
+            schema_offset,
+            self._entry_index,
+            self._string_index,
+            _,
+            _,
+            self.generation,
+        ) = header
+        self.schema: Schema = tuple(
+            (self.string(sid), bool(is_list))
+            for sid, is_list in SCHEMA_FIELD.iter_unpack(
+                self._mmap[
+                    schema_offset : schema_offset + SCHEMA_FIELD.size * field_count
+                ]
+            )
+        )
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def string(self, sid: int) -> Optional[str]:
+        if sid == NONE:
+            return None
+        start, end = struct.unpack_from(
+            "<2Q", self._mmap, self._string_index + OFFSET.size * sid
+        )
+        return self._mmap[start:end].decode("utf-8")
+
+    def _entry_offset(self, i: int) -> int:
+        return OFFSET.unpack_from(self._mmap, self._entry_index + OFFSET.size * i)[0]
+
+    def key(self, i: int) -> str:
+        # The first schema field is the key, entries are sorted by it.
+        return self.string(U32.unpack_from(self._mmap, self._entry_offset(i))[0])
+
+    def entry(self, i: int) -> Dict[str, Any]:
+        position = self._entry_offset(i)
+        value: Dict[str, Any] = {}
+        for name, is_list in self.schema:
+            (number,) = U32.unpack_from(self._mmap, position)
+            position += U32.size
+            if is_list:
+                ids = struct.unpack_from(f"<{number}I", self._mmap, position)
+                position += U32.size * number
+                value[name] = [self.string(sid) for sid in ids]
+            else:
+                value[name] = self.string(number)
+        return value
+
+    def bisect(self, key: str, right: bool = False) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.key(mid)
+            if current < key or (right and current == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, key: str) -> int:
+        i = self.bisect(key)
+        if i < self.count and self.key(i) == key:
+            return i
+        return -1
+
+    def keys(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self.key(i)
+
+    def items(self, start: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for i in range(start, self.count):
+            value = self.entry(i)
+            yield value[self.schema[0][0]], value
+
+
+def merge_items(
+    items: Iterable[Tuple[str, Dict[str, Any]]], pending: List[str], deleted: Set[str]
+) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    # Merges sorted snapshot items with the sorted keys held elsewhere, which
+    # are yielded with None in place of the snapshot value.
+    j = 0
+    for key, value in items:
+        while j < len(pending) and pending[j] < key:
+            yield pending[j], None
+            j += 1
+        if j < len(pending) and pending[j] == key:
+            yield key, None
+            j += 1
+        elif key not in deleted:
+            yield key, value
+    for key in pending[j:]:
+        yield key, None
+
+
+class SnapshotMapping(MutableMapping):
+    # Items are decoded from the memory-mapped snapshot when first accessed.
+    # Accessed, added and journaled items live in the overlay, removed keys
+    # in deleted; everything else is still only in the snapshot.
+    def __init__(
+        self,
+        snapshot: Optional[Snapshot],
+        factory: Callable[[Dict[str, Any]], Any],
+        adopt: Optional[Callable[[Any], None]] = None,
+    ):
+        self.snapshot = snapshot
+        self.factory = factory
+        self.adopt = adopt
+        self.overlay: Dict[str, Any] = {}
+        self.deleted = set()
+        self.added = 0
+
+    def _in_snapshot(self, key: str) -> bool:
+        return self.snapshot is not None and self.snapshot.find(key) >= 0
+
+    def materialize(self, value: Dict[str, Any]) -> Any:
+        item = self.factory(value)
+        if self.adopt is not None:
+            self.adopt(item)
+        return item
+
+    def _snapshot_value(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.snapshot is None or key in self.deleted:
+            return None
+        i = self.snapshot.find(key)
+        return self.snapshot.entry(i) if i >= 0 else None
+
+    def __getitem__(self, key: str) -> Any:
+        item = self.overlay.get(key)
+        if item is not None:
+            return item
+        value = self._snapshot_value(key)
+        if value is None:
+            raise KeyError(key)
+        item = self.overlay[key] = self.materialize(value)
+        return item
+
+    def __setitem__(self, key: str, item: Any) -> None:
+        if key in self.deleted:
+            self.deleted.discard(key)
+        elif key not in self.overlay and not self._in_snapshot(key):
+            self.added += 1
+        self.overlay[key] = item
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        if self._in_snapshot(key):
+            self.deleted.add(key)
+        else:
+            self.added -= 1
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.overlay:
+            return True
+        return key not in self.deleted and self._in_snapshot(key)
+
+    def __iter__(self) -> Iterator[str]:
+        # Only the keys of snapshot entries are read.
+        pending = sorted(self.overlay)
+        keys = self.snapshot.keys() if self.snapshot is not None else ()
+        for key, _ in merge_items(((key, None) for key in keys), pending, self.deleted):
+            yield key
+
+    def __len__(self) -> int:
+        count = len(self.snapshot) if self.snapshot is not None else 0
+        return count - len(self.deleted) + self.added
+
+    def _merged(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        # Yields keys in sorted order with the snapshot value, or None when
+        # the overlay holds the current item. Only keys after `after` are
+        # visited, so a listing can continue where the last page stopped.
+        pending = sorted(key for key in self.overlay if after is None or key > after)
+        items: Iterable[Tuple[str, Dict[str, Any]]] = ()
+        if self.snapshot is not None:
+            start = 0 if after is None else self.snapshot.bisect(after, right=True)
+            items = self.snapshot.items(start)
+        return merge_items(items, pending, self.deleted)
+
+    def iter_items(self, after: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        for key, value in self._merged(after):
+            item = self.overlay.get(key)
+            yield key, item if item is not None else self.materialize(value)
+
+    def iter_dicts(
+        self, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for key, value in self._merged(after):
+            yield key, value if value is not None else self.overlay[key].to_dict()
+
+    def values(self) -> ValuesView:
+        return SnapshotValuesView(self)
+
+    def items(self) -> ItemsView:
+        return SnapshotItemsView(self)
+
+    def capture(
+        self,
+    ) -> Tuple[Optional[Snapshot], Dict[str, Dict[str, Any]], Set[str]]:
+        # A frozen copy of the changes on top of the snapshot. Together with
+        # the snapshot it describes the current state and can be written out
+        # while this mapping keeps changing.
+        changes = {key: item.to_dict() for key, item in self.overlay.items()}
+        return self.snapshot, changes, set(self.deleted)
+
+    @staticmethod
+    def captured_items(
+        snapshot: Optional[Snapshot],
+        changes: Dict[str, Dict[str, Any]],
+        deleted: Set[str],
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        items = snapshot.items() if snapshot is not None else ()
+        for key, value in merge_items(items, sorted(changes), deleted):
+            yield key, value if value is not None else changes[key]
+
+    def swap(
+        self, snapshot: Snapshot, changes: Dict[str, Any], deleted: Set[str]
+    ) -> None:
+        # Moves onto a snapshot written from capture(). Only keys changed
+        # before or after the capture can differ between the new snapshot and
+        # the current state, so deleted and added are recounted for those.
+        old, old_deleted = self.snapshot, self.deleted
+
+        def live(key: str) -> bool:
+            if key in self.overlay:
+                return True
+            return old is not None and key not in old_deleted and old.find(key) >= 0
+
+        self.deleted, self.added = set(), 0
+        for key in set(changes) | deleted | set(self.overlay) | old_deleted:
+            in_snapshot = snapshot.find(key) >= 0
+            if in_snapshot and not live(key):
+                self.deleted.add(key)
+            elif not in_snapshot and live(key):
+                self.added += 1
+        self.snapshot = snapshot
+        if old is not None:
+            old.close()
+
+    def rebase(self, snapshot: Snapshot) -> None:
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = snapshot
+        self.deleted.clear()
+        self.added = 0
+
+    def close(self) -> None:
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+
+class SnapshotValuesView(ValuesView):
+    def __iter__(self):
+        for _, item in self._mapping.iter_items():
+            yield item
+
+
+class SnapshotItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
@@ -1,13 +1,287 @@
 from collections import UserDict
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
-import pickle
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Iterator, Optional, List, Dict, Tuple
+from ..models.base import ConflictError, ValidationError
+from ..models.contact import Phone
+from .backends import SnapshotBackend, StorageBackend
+from .cache import LRUCache, RENDERED_SIZE, RESULTS_SIZE, cached_listing
+from .index import BirthdayIndex, ExactIndex, SuggestionIndex, TrigramIndex
+from .paging import Source, iter_sorted, iter_stored
 from .record import Record
+from . import transfer
+
+# Fields are read from the stored form of a contact (Record.to_dict), so the
+# indexes can be built from a snapshot without decoding every contact.
+Fields = Dict[str, Callable[[Dict[str, Any]], List[str]]]
+
+SEARCH_FIELDS: Fields = {
+    "name": lambda value: [value["name"]],
+    "phone": lambda value: value["phones"],
+    "email": lambda value: [value["email"]] if value["email"] else [],
+    "address": lambda value: [value["address"]] if value["address"] else [],
+}
+
+# Values that identify a contact, normalized the way lookups normalize them.
+OWNER_FIELDS: Fields = {
+    "phone": lambda value: value["phones"],
+    "email": lambda value: [value["email"].lower()] if value["email"] else [],
+}
+
+
+def stored_birthday(value: Dict[str, Any]) -> Optional[date]:
+    # Stored birthdays were validated when set, so they are only parsed.
+    if not value["birthday"]:
+        return None
+    day, month, year = map(int, value["birthday"].split("."))
+    return date(year, month, day)
 
 
 class AddressBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        self.backend: Optional[StorageBackend] = None
+        self._search_index: Optional[Dict[str, TrigramIndex]] = None
+        self._birthday_index: Optional[BirthdayIndex] = None
+        self._name_index: Optional[SuggestionIndex] = None
+        self._owner_index: Optional[Dict[str, ExactIndex]] = None
+        # Set once a search or suggestion has read the stored contacts, or
+        # their names, instead of an index.
+        self._scanned = False
+        self._suggested = False
+        # Bumped by every change, so cached results from before it are stale.
+        self.generation = 0
+        # Weighed by the number of keys listed, and by the rendered items.
+        self.results = LRUCache("contacts", RESULTS_SIZE)
+        self.rendered = LRUCache("contacts_rendered", RENDERED_SIZE)
+        # Told about every change, e.g. to schedule a background save.
+        self.on_change: Optional[Callable[[], None]] = None
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        record._book = self
+        self.data[name] = record
+        self.record_changed(record)
+
+    def __delitem__(self, name: str) -> None:
+        del self.data[name]
+        if self.backend is not None:
+            self._write(self.backend.delete, name)
+        self._unindex(name)
+        if self.on_change is not None:
+            self.on_change()
+
     def add_record(self, record: Record) -> None:
+        self[record.name.value] = record
+
+    @contextmanager
+    def editing(self, record: Record):
+        # Wraps a change to a record of this book, which is stored once made.
+        yield
+        self.record_changed(record)
+
+    def record_changed(self, record: Record) -> None:
+        # Lazily loaded mappings only keep items that are written back.
         self.data[record.name.value] = record
+        if self.backend is not None:
+            self._write(self.backend.put, record.name.value, record.to_dict())
+        self._reindex(record)
+        if self.on_change is not None:
+            self.on_change()
+
+    def _write(self, write: Callable, *args) -> None:
+        try:
+            write(*args)
+        except ConflictError:
+            # The backend has taken in the other process's version.
+            self.refresh()
+            raise
+
+    def _reindex(self, record: Record) -> None:
+        self.generation += 1
+        name, value = record.name.value, record.to_dict()
+        if self._search_index is not None:
+            self._index_fields(self._search_index, SEARCH_FIELDS, name, value)
+        if self._birthday_index is not None:
+            birthday = stored_birthday(value)
+            if birthday is None:
+                self._birthday_index.remove(name)
+            else:
+                self._birthday_index.add(name, birthday)
+        if self._name_index is not None:
+            self._name_index.add(name)
+        if self._owner_index is not None:
+            self._index_fields(self._owner_index, OWNER_FIELDS, name, value)
+
+    def _unindex(self, name: str) -> None:
+        self.generation += 1
+        if self._search_index is not None:
+            for index in self._search_index.values():
+                index.remove(name)
+        if self._birthday_index is not None:
+            self._birthday_index.remove(name)
+        if self._name_index is not None:
+            self._name_index.remove(name)
+        if self._owner_index is not None:
+            for index in self._owner_index.values():
+                index.remove(name)
+
+    def refresh(self) -> None:
+        # Takes in changes made by other memok processes sharing the data.
+        if self.backend is None:
+            return
+        changed = self.backend.refresh()
+        if changed is None:
+            self.data = self.backend.mapping
+            self._reset_indexes()
+            return
+        for name in changed:
+            record = self.data.get(name)
+            if record is None:
+                self._unindex(name)
+            else:
+                self._reindex(record)
+
+    def _reset_indexes(self) -> None:
+        self.generation += 1
+        self._search_index = None
+        self._birthday_index = None
+        self._name_index = None
+        self._owner_index = None
+        self._scanned = False
+        self._suggested = False
+
+    @staticmethod
+    def _index_fields(
+        indexes: Dict[str, Any], fields: Fields, name: str, value: Dict[str, Any]
+    ) -> None:
+        for field, values in fields.items():
+            indexes[field].add(name, values(value))
+
+    @property
+    def birthday_index(self) -> BirthdayIndex:
+        if self._birthday_index is None:
+            self._birthday_index = BirthdayIndex(
+                (name, birthday)
+                for name, value in iter_stored(self.data)
+                for birthday in [stored_birthday(value)]
+                if birthday is not None
+            )
+        return self._birthday_index
+
+    @property
+    def search_index(self) -> Dict[str, TrigramIndex]:
+        if self._search_index is None:
+            search_index = {field: TrigramIndex() for field in SEARCH_FIELDS}
+            for name, value in iter_stored(self.data):
+                self._index_fields(search_index, SEARCH_FIELDS, name, value)
+            self._search_index = search_index
+        return self._search_index
+
+    @property
+    def owner_index(self) -> Dict[str, ExactIndex]:
+        if self._owner_index is None:
+            owner_index = {field: ExactIndex() for field in OWNER_FIELDS}
+            for name, value in iter_stored(self.data):
+                self._index_fields(owner_index, OWNER_FIELDS, name, value)
+            self._owner_index = owner_index
+        return self._owner_index
+
+    @property
+    def name_index(self) -> SuggestionIndex:
+        if self._name_index is None:
+            self._name_index = SuggestionIndex(self.data)
+        return self._name_index
+
+    def suggest(self, name: str, n: int = 1) -> List[str]:
+        if self._name_index is None and not self._suggested:
+            # Like the first search, a first mistyped name compares the
+            # stored names instead of indexing them all.
+            self._suggested = True
+            return SuggestionIndex.scan(self.data, name, n)
+        return self.name_index.suggest(name, n)
+
+    def find_owners(self, value: str) -> List[Record]:
+        if "@" in value:
+            names = self.owner_index["email"].get(value.lower())
+        else:
+            names = self.owner_index["phone"].get(Phone.normalize_phone(value))
+        return [self.data[name] for name in sorted(names)]
+
+    def iter_duplicates(
+        self, field: Optional[str] = None, after: Optional[str] = None
+    ) -> Iterator[Tuple[str, str, List[str]]]:
+        if field is not None and field not in OWNER_FIELDS:
+            raise ValidationError(f"Unknown duplicate field: {field}")
+        fields = sorted(OWNER_FIELDS) if field is None else [field]
+        return self._iter_duplicates(fields, after)
+
+    def _iter_duplicates(
+        self, fields: List[str], after: Optional[str]
+    ) -> Iterator[Tuple[str, str, List[str]]]:
+        # Keys are "field value", so a page can continue in the middle of a field.
+        after_field, _, after_value = (after or "").partition(" ")
+        for field in fields:
+            if after is not None and field < after_field:
+                continue
+            start = after_value if after is not None and field == after_field else None
+            for value, owners in self.owner_index[field].duplicates(start):
+                yield field, value, owners
+
+    def search(self, query: str, field: Optional[str] = None) -> List[Record]:
+        return list(self.iter_search(query, field))
+
+    def iter_search(
+        self, query: str, field: Optional[str] = None, after: Optional[str] = None
+    ) -> Iterator[Record]:
+        if field is not None and field not in SEARCH_FIELDS:
+            raise ValidationError(f"Unknown search field: {field}")
+        fields = list(SEARCH_FIELDS) if field is None else [field]
+        query = query.lower()
+        return self._iter_matches(query, fields, after)
+
+    def search_listing(self, query: str, field: Optional[str] = None) -> Source:
+        return cached_listing(
+            self.results,
+            ("search", query.lower(), field),
+            lambda: self.generation,
+            lambda after: self.iter_search(query, field, after),
+            lambda record: record.name.value,
+        )
+
+    def render(self, name: str) -> str:
+        return self.rendered.lookup(name, self.generation, lambda: str(self.data[name]))
+
+    @staticmethod
+    def _matches(query: str, fields: List[str], value: Dict[str, Any]) -> bool:
+        return any(
+            query in text.lower() for f in fields for text in SEARCH_FIELDS[f](value)
+        )
+
+    def _iter_matches(
+        self, query: str, fields: List[str], after: Optional[str]
+    ) -> Iterator[Record]:
+        if self._search_index is None and not self._scanned:
+            # The first search after loading reads the stored contacts in
+            # order, which ends as soon as a page is full, so a one-off find
+            # does not wait for the index. The next search builds it.
+            self._scanned = True
+            for name, value in iter_stored(self.data, after):
+                if self._matches(query, fields, value):
+                    yield self.data[name]
+            return
+        candidates = set()
+        for f in fields:
+            candidates |= self.search_index[f].candidates(query)
+        for name in sorted(candidates):
+            if after is not None and name <= after:
+                continue
+            record = self.data[name]
+            if self._matches(query, fields, record.to_dict()):
+                yield record
+
+    def iter_records(self, after: Optional[str] = None) -> Iterator[Record]:
+        for _, record in iter_sorted(self.data, after):
+            yield record
 
     def find(self, name: str) -> Optional[Record]:
         return self.data.get(name)
@@ -15,50 +289,85 @@ class AddressBook(UserDict):
     def delete(self, name: str) -> None:
         if name not in self.data:
             raise KeyError(f"Contact {name} not found")
-        del self.data[name]
+        del self[name]
 
     def get_upcoming_birthdays(self, days: int = 7) -> List[Dict]:
         today = datetime.today().date()
+        return self.results.lookup(
+            ("upcoming", today, days),
+            self.generation,
+            lambda: self.get_birthdays_between(today, today + timedelta(days=days)),
+        )
+
+    def get_birthdays_between(self, start: date, end: date) -> List[Dict]:
         upcoming_birthdays = []
+        for birthday, name in self.birthday_index.between(start, end):
+            congratulation_date = birthday
+            if birthday.weekday() >= 5:
+                congratulation_date += timedelta(days=(7 - birthday.weekday()))
+            upcoming_birthdays.append(
+                {
+                    "name": name,
+                    "birthday": f"{birthday:%d.%m.%Y}",
+                    "congratulation_date": f"{congratulation_date:%d.%m.%Y}",
+                }
+            )
+        return upcoming_birthdays
 
-        for record in self.data.values():
-            if not record.birthday:
-                continue
+    def get_birthdays_in_month(self, month: int) -> List[Dict]:
+        if not 1 <= month <= 12:
+            raise ValidationError("Month must be between 1 and 12")
+        return [
+            {"name": name, "birthday": str(self.data[name].birthday)}
+            for _, _, name in self.birthday_index.in_month(month)
+        ]
 
-            birthday_date = record.birthday.value
-            birthday_this_year = birthday_date.replace(year=today.year)
-
-            if birthday_this_year < today:
-                birthday_this_year = birthday_this_year.replace(year=today.year + 1)
-
-            days_until = (birthday_this_year - today).days
-            if 0 <= days_until <= days:
-                congratulation_date = birthday_this_year
-                if birthday_this_year.weekday() >= 5:
-                    congratulation_date += timedelta(
-                        days=(7 - birthday_this_year.weekday())
-                    )
-
-                upcoming_birthdays.append(
-                    {
-                        "name": record.name.value,
-                        "birthday": birthday_this_year.strftime("%d.%m.%Y"),
-                        "congratulation_date": congratulation_date.strftime("%d.%m.%Y"),
-                    }
-                )
-
-        return sorted(
-            upcoming_birthdays,
-            key=lambda x: datetime.strptime(x["birthday"], "%d.%m.%Y"),
-        )
+    def _adopt(self, record: Record) -> None:
+        record._book = self
+
+    def open(self, backend: StorageBackend) -> None:
+        if self.backend is not None:
+            self.backend.close()
+        self.backend = backend
+        self.data = backend.load(self._adopt)
+        self._reset_indexes()
+
+    def commit(self, lock=None) -> None:
+        if self.backend is None:
+            return
+        if lock is None:
+            self.backend.commit(self.data)
+        else:
+            self.backend.background_commit(self.data, lock)
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
+
+    @contextmanager
+    def bulk(self):
+        # Indexes are rebuilt on next use rather than updated per record.
+        self._reset_indexes()
+        if self.backend is None:
+            yield
+            return
+        with self.backend.bulk(self.data):
+            yield
+        self.refresh()
+
+    def import_from(
+        self, filename: str, fmt: Optional[str] = None, workers: Optional[int] = None
+    ) -> transfer.ImportReport:
+        return transfer.import_records(self, filename, fmt, workers)
+
+    def export_to(self, filename: str, fmt: Optional[str] = None) -> int:
+        return transfer.export_records(self, filename, fmt)
 
     def save_to_file(self, filename: str = "addressbook.pkl") -> None:
-        with open(filename, "wb") as f:
-            pickle.dump(self.data, f)
+        backend = self.backend
+        if not isinstance(backend, SnapshotBackend) or backend.filename != filename:
+            backend = SnapshotBackend(filename, Record.from_dict, Record.FIELDS)
+        backend.save(self.data)
 
     def load_from_file(self, filename: str = "addressbook.pkl") -> None:
-        try:
-            with open(filename, "rb") as f:
-                self.data = pickle.load(f)
-        except FileNotFoundError:
-            self.data = {}
+        self.open(SnapshotBackend(filename, Record.from_dict, Record.FIELDS))
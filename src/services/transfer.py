@@ -0,0 +1,217 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from itertools import islice
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from ..models.base import ValidationError
+from .record import Record
+
+FORMATS = ("csv", "jsonl", "vcf")
+CSV_COLUMNS = ["name", "phones", "birthday", "email", "address"]
+VCARD_DATE = re.compile(r"^(\d{4})-?(\d{2})-?(\d{2})")
+
+Row = Tuple[int, Dict[str, Any]]
+
+
+class ImportReport:
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def __str__(self) -> str:
+        return (
+            f"Imported {self.added + self.updated} contacts "
+            f"({self.added} added, {self.updated} updated), "
+            f"{len(self.errors)} rows failed."
+        )
+
+
+def detect_format(filename: str, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or os.path.splitext(filename)[1].lstrip(".")).lower()
+    if fmt in ("vcard", "vcf"):
+        return "vcf"
+    if fmt in ("json", "jsonl", "ndjson"):
+        return "jsonl"
+    if fmt not in FORMATS:
+        raise ValidationError(f"Unknown format '{fmt}'. Use one of: csv, jsonl, vcf")
+    return fmt
+
+
+def read_csv(f) -> Iterator[Row]:
+    reader = csv.DictReader(f)
+    for row in reader:
+        phones = row.get("phones") or row.get("phone") or ""
+        yield reader.line_num, {
+            "name": (row.get("name") or "").strip(),
+            "phones": [p.strip() for p in phones.split(";") if p.strip()],
+            "birthday": row.get("birthday") or None,
+            "email": row.get("email") or None,
+            "address": row.get("address") or None,
+        }
+
+
+def read_jsonl(f) -> Iterator[Row]:
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, {"error": f"Invalid JSON: {e.msg}"}
+
+
+def _unfold(f) -> Iterator[Tuple[int, str]]:
+    # vCard lines starting with whitespace continue the previous line.
+    start, current = 0, None
+    for line_no, line in enumerate(f, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        start, current = line_no, line
+    if current is not None:
+        yield start, current
+
+
+def read_vcard(f) -> Iterator[Row]:
+    card: Optional[Dict[str, Any]] = None
+    start = 0
+    for line_no, line in _unfold(f):
+        prop, _, value = line.partition(":")
+        name = prop.split(";")[0].upper()
+        if name == "BEGIN":
+            card, start = {"name": "", "phones": []}, line_no
+        elif card is None:
+            continue
+        elif name == "END":
+            yield start, card
+            card = None
+        elif name == "FN":
+            card["name"] = value.strip()
+        elif name == "N" and not card["name"]:
+            family, given = (value.split(";") + [""])[:2]
+            card["name"] = f"{given} {family}".strip()
+        elif name == "TEL":
+            card["phones"].append(value.strip())
+        elif name == "EMAIL":
+            card.setdefault("email", value.strip())
+        elif name == "ADR":
+            parts = [part.strip() for part in value.split(";") if part.strip()]
+            card.setdefault("address", ", ".join(parts))
+        elif name == "BDAY":
+            match = VCARD_DATE.match(value.strip())
+            year, month, day = match.groups() if match else ("", "", "")
+            card["birthday"] = f"{day}.{month}.{year}" if match else value.strip()
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "vcf": read_vcard}
+
+
+def validate_rows(rows: List[Row]) -> List[Tuple[int, Optional[Record], str]]:
+    results = []
+    for line_no, row in rows:
+        try:
+            if "error" in row:
+                raise ValidationError(row["error"])
+            results.append((line_no, Record.from_dict(row), ""))
+        except ValidationError as e:
+            results.append((line_no, None, str(e)))
+        except (KeyError, TypeError, AttributeError) as e:
+            results.append((line_no, None, f"Malformed row: {e}"))
+    return results
+
+
+def _chunks(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validated_records(
+    rows: Iterable[Row], workers: Optional[int] = None, chunk_size: int = 2000
+) -> Iterator[Tuple[int, Optional[Record], str]]:
+    chunks = _chunks(rows, chunk_size)
+    first = next(chunks, None)
+    second = next(chunks, None)
+    if first is None:
+        return
+    if second is None or workers == 1:
+        # Small inputs are not worth starting worker processes for.
+        for chunk in (first, second, *chunks):
+            if chunk:
+                yield from validate_rows(chunk)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of chunks in flight so huge files stream.
+        pending = [executor.submit(validate_rows, first)]
+        pending.append(executor.submit(validate_rows, second))
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                yield from pending.pop(0).result()
+            pending.append(executor.submit(validate_rows, chunk))
+        for future in pending:
+            yield from future.result()
+
+
+def import_records(
+    book,
+    filename: str,
+    fmt: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> ImportReport:
+    fmt = detect_format(filename, fmt)
+    report = ImportReport()
+    with open(filename, encoding="utf-8", newline="") as f:
+        with book.bulk():
+            for line_no, record, error in validated_records(READERS[fmt](f), workers):
+                if record is None:
+                    report.errors.append((line_no, error))
+                    continue
+                if record.name.value in book:
+                    report.updated += 1
+                else:
+                    report.added += 1
+                book.add_record(record)
+    return report
+
+
+def _vcard(record: Record) -> str:
+    lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{record.name.value}"]
+    lines.extend(f"TEL;TYPE=CELL:{phone.value}" for phone in record.phones)
+    if record.email:
+        lines.append(f"EMAIL:{record.email.value}")
+    if record.address:
+        lines.append(f"ADR:;;{record.address.value};;;;")
+    if record.birthday:
+        lines.append(f"BDAY:{record.birthday.value:%Y-%m-%d}")
+    lines.append("END:VCARD")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def export_records(book, filename: str, fmt: Optional[str] = None) -> int:
+    fmt = detect_format(filename, fmt)
+    count = 0
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+        for record in book.iter_records():
+            data = record.to_dict()
+            if fmt == "csv":
+                data["phones"] = ";".join(data["phones"])
+                writer.writerow(data)
+            elif fmt == "jsonl":
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            else:
+                f.write(_vcard(record))
+            count += 1
+    return count
@@ -0,0 +1,63 @@
+import atexit
+import sys
+import threading
+from typing import Callable, Optional
+
+
+class BackgroundWriter:
+    # Commits changes on a thread of its own. Notifications that arrive
+    # within one interval are coalesced into a single commit, so a burst of
+    # commands costs one write instead of one per command.
+    def __init__(self, commit: Callable[[], None], interval: float = 1.0):
+        self.commit = commit
+        self.interval = interval
+        self.error: Optional[BaseException] = None
+        self._dirty = threading.Event()
+        self._stopping = threading.Event()
+        # Serializes commits from the thread and from flush().
+        self._committing = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="memok-writer", daemon=True
+        )
+        self._thread.start()
+        # Daemon threads are killed at exit, so pending changes are written
+        # by the exit handler if close() was never called.
+        atexit.register(self.close)
+
+    def notify(self) -> None:
+        self._dirty.set()
+
+    def _run(self) -> None:
+        while True:
+            self._dirty.wait()
+            if self._stopping.wait(self.interval):
+                return
+            self._commit()
+
+    def _commit(self) -> None:
+        with self._committing:
+            self._dirty.clear()
+            try:
+                self.commit()
+            except Exception as e:
+                # Keep the thread alive: the next commit retries everything
+                # that is still pending.
+                self.error = e
+                self._dirty.set()
+                print(f"Background save failed: {e}", file=sys.stderr)
+            else:
+                self.error = None
+
+    def flush(self) -> None:
+        self._commit()
+        if self.error is not None:
+            raise self.error
+
+    def close(self) -> None:
+        if self._stopping.is_set():
+            return
+        atexit.unregister(self.close)
+        self._stopping.set()
+        self._dirty.set()
+        self._thread.join()
+        self.flush()